@@ -1,6 +1,8 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
+# Must come before the route imports: pymongo only attaches listeners to clients created afterwards
+from utils.query_monitor import init_query_monitor
 from routes.student_routes import student_bp
 from routes.teacher_auth import teacher_bp
 from routes.attendance_live import live_attendance_bp
@@ -22,6 +24,8 @@ load_dotenv()
 app = Flask(__name__)
 # Allow all origins for now to prevent CORS issues on mobile/web deployment
 CORS(app, resources={r"/*": {"origins": "*"}})
+# Per-request Mongo query count / time headers, N+1 warnings in the log
+init_query_monitor(app)
 
 # ==================================================
 # IMPORT & REGISTER BLUEPRINTS
@@ -40,11 +44,34 @@ app.register_blueprint(download_bp)
 app.register_blueprint(analytics_bp) # Register analytics blueprint
 from routes.recognition_routes import recognition_bp
 app.register_blueprint(recognition_bp)
+from routes.recognition_stream import init_stream
+init_stream(app)  # /ws/recognition, only when flask-sock is installed
+from routes.metrics_routes import metrics_bp
+app.register_blueprint(metrics_bp)  # GET /metrics, plain text stage latencies
+
+# ==================================================
+# INFERENCE BACKPRESSURE
+# ==================================================
+from utils.inference_pool import InferenceOverloaded
+
+@app.errorhandler(InferenceOverloaded)
+def inference_overloaded(e):
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
 from routes.hod_auth import hod_bp
 app.register_blueprint(hod_bp)
 from routes.manual_attendance import manual_attendance_bp
 app.register_blueprint(manual_attendance_bp)
 
+# ==================================================
+# DATABASE INDEXES (idempotent, see utils/db_indexes.py)
+# ==================================================
+from utils.db_indexes import ENSURE_INDEXES, ensure_indexes
+if ENSURE_INDEXES:
+    print(f"Index check: {ensure_indexes()}")
+
 # ==================================================
 # PRE-WARM SERVICE (Load model & data once)
 # ==================================================
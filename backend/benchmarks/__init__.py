@@ -0,0 +1 @@
+# Offline benchmarks for the recognition path (run from backend/: python -m benchmarks.<name>)
@@ -0,0 +1,97 @@
+"""
+Recall-vs-latency benchmark for the IVF index against the exact matcher.
+
+    python -m benchmarks.ann_recall --sizes 20000 50000 --probes 1 4 8 16
+
+Recall is the share of exact matches (top-1 at or above ARC_THRESHOLD) that
+the index returns as its top-1; "decisions" is the share of all queries,
+impostors included, that get the same match / no-match outcome, which is
+what attendance actually depends on.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_gallery, make_queries
+from utils.ann_index import IVFIndex
+from utils.face_matcher import ARC_THRESHOLD, FaceMatcher
+from utils.student_data import StudentGallery
+
+
+def _decisions(idx, scores, threshold):
+    top = idx[:, 0].copy()
+    top[scores[:, 0] < threshold] = -1
+    return top
+
+
+def _time_batches(fn, queries, batch):
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        fn(queries[i:i + batch])
+    return (time.perf_counter() - start) / max(1, -(-len(queries) // batch)) * 1000
+
+
+def run(sizes, probes, lists, queries_per_size, batch, threshold):
+    results = []
+    for size in sizes:
+        gallery = make_gallery(size)
+        queries, _ = make_queries(gallery, queries_per_size)
+        rolls = [str(i) for i in range(size)]
+        exact_gallery = StudentGallery().load(rolls, rolls, [None] * size, [None] * size, gallery, build_index=False)
+        matcher = FaceMatcher(exact_gallery)
+
+        exact_idx, exact_scores = matcher.search(queries)
+        exact_ms = _time_batches(matcher.search, queries, batch)
+        exact_decisions = _decisions(exact_idx, exact_scores, threshold)
+        matched = exact_decisions >= 0
+
+        for n_lists in lists or [None]:
+            start = time.perf_counter()
+            index = IVFIndex(n_lists=n_lists).build(gallery)
+            build_s = time.perf_counter() - start
+
+            for n_probe in probes:
+                ann_idx, ann_scores = index.search(queries, n_probe=n_probe)
+                ann_ms = _time_batches(lambda q: index.search(q, n_probe=n_probe), queries, batch)
+                row = {
+                    "gallery": size,
+                    "lists": index.n_lists,
+                    "probes": n_probe,
+                    "recall_at_1": float(np.mean(ann_idx[matched, 0] == exact_idx[matched, 0])),
+                    "decisions": float(np.mean(_decisions(ann_idx, ann_scores, threshold) == exact_decisions)),
+                    "exact_ms_per_batch": round(exact_ms, 3),
+                    "ann_ms_per_batch": round(ann_ms, 3),
+                    "speedup": round(exact_ms / ann_ms, 2) if ann_ms else None,
+                    "build_s": round(build_s, 2)
+                }
+                results.append(row)
+                print(
+                    f"gallery={size:>7} lists={row['lists']:>5} probes={n_probe:>3} "
+                    f"recall@1={row['recall_at_1']:.4f} decisions={row['decisions']:.4f} "
+                    f"exact={exact_ms:8.2f}ms ann={ann_ms:8.2f}ms x{row['speedup']}"
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 50000])
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--lists", type=int, nargs="*", default=[], help="IVF list counts (default: sqrt(N))")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=64, help="faces per match call, e.g. one group photo")
+    parser.add_argument("--threshold", type=float, default=ARC_THRESHOLD)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.probes, args.lists, args.queries, args.batch, args.threshold)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {len(results)} rows to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
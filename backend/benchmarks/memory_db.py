@@ -0,0 +1,183 @@
+"""
+Tiny in-memory stand-in for the pymongo collections the attendance routes
+write to, so persistence can be benchmarked without a Mongo server. Supports
+equality and $in filters, inclusion projections, find / find_one,
+insert_many, update_one(upsert) and bulk_write of UpdateOne operations, and
+counts every call like a round trip.
+
+Like the indexes utils.db_indexes declares, lookups go through a hash index
+per set of equality fields (built on first use, kept up to date by every
+write), so a stage's time grows with the documents it touches rather than
+with the collection: the db stage reflects round trips, not scans of the
+stand-in.
+"""
+import copy
+from collections import defaultdict
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        value = doc.get(key)
+        if isinstance(cond, dict) and "$in" in cond:
+            if value not in cond["$in"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+def _hashable(value):
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _values(doc, fields):
+    return tuple(_hashable(doc.get(f)) for f in fields)
+
+
+def _equality_fields(query):
+    """Sorted equality fields of a query: the key of the hash index it can use."""
+    return tuple(sorted(k for k, v in query.items() if not isinstance(v, dict)))
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    included = [k for k, v in projection.items() if v]
+    if included:
+        out = {k: copy.deepcopy(doc[k]) for k in included if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k not in projection}
+
+
+class UpdateResult:
+    def __init__(self, matched, modified, upserted_id=None):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.upserted_id = upserted_id
+
+
+class BulkWriteResult:
+    def __init__(self):
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = 0
+        self.upserted_ids = {}
+
+
+class MemoryCollection:
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self.calls = 0
+        self._next_id = 1
+        self._indexes = {}   # equality fields -> {values: [docs]}
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    def _index(self, fields):
+        index = self._indexes.get(fields)
+        if index is None:
+            index = self._indexes[fields] = defaultdict(list)
+            for doc in self.docs:
+                index[_values(doc, fields)].append(doc)
+        return index
+
+    def _add(self, doc):
+        self.docs.append(doc)
+        for fields, index in self._indexes.items():
+            index[_values(doc, fields)].append(doc)
+
+    def _reindex(self, doc, before):
+        for fields, index in self._indexes.items():
+            old, new = _values(before, fields), _values(doc, fields)
+            if old != new:
+                bucket = index[old]
+                bucket[:] = [d for d in bucket if d is not doc]
+                index[new].append(doc)
+
+    def _candidates(self, query):
+        """Docs that can match query: one index bucket, the buckets of a single $in, or all."""
+        fields = _equality_fields(query)
+        if fields:
+            return self._index(fields).get(tuple(_hashable(query[f]) for f in fields), [])
+        if len(query) == 1:
+            key, cond = next(iter(query.items()))
+            if isinstance(cond, dict) and set(cond) == {"$in"}:
+                index = self._index((key,))
+                return [d for value in dict.fromkeys(map(_hashable, cond["$in"])) for d in index.get((value,), [])]
+        return self.docs
+
+    def insert_many(self, docs):
+        self.calls += 1
+        for doc in docs:
+            doc = copy.deepcopy(doc)
+            doc.setdefault("_id", self._new_id())
+            self._add(doc)
+
+    def find(self, query=None, projection=None):
+        self.calls += 1
+        query = query or {}
+        return [_project(d, projection) for d in self._candidates(query) if _matches(d, query)]
+
+    def find_one(self, query=None, projection=None):
+        self.calls += 1
+        query = query or {}
+        for doc in self._candidates(query):
+            if _matches(doc, query):
+                return _project(doc, projection)
+        return None
+
+    def _update(self, query, update, upsert):
+        for doc in self._candidates(query):
+            if _matches(doc, query):
+                before = dict(doc)
+                doc.update(copy.deepcopy(update.get("$set", {})))
+                self._reindex(doc, before)
+                return UpdateResult(1, int(before != doc))
+        if upsert:
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            doc.update(copy.deepcopy(update.get("$set", {})))
+            doc.update(copy.deepcopy(update.get("$setOnInsert", {})))
+            doc["_id"] = self._new_id()
+            self._add(doc)
+            return UpdateResult(0, 0, doc["_id"])
+        return UpdateResult(0, 0)
+
+    def update_one(self, query, update, upsert=False):
+        self.calls += 1
+        return self._update(query, update, upsert)
+
+    def bulk_write(self, requests, ordered=True):
+        self.calls += 1
+        result = BulkWriteResult()
+        for i, op in enumerate(requests):
+            # pymongo UpdateOne keeps its arguments in private slots
+            outcome = self._update(op._filter, op._doc, op._upsert)
+            result.matched_count += outcome.matched_count
+            result.modified_count += outcome.modified_count
+            if outcome.upserted_id is not None:
+                result.upserted_count += 1
+                result.upserted_ids[i] = outcome.upserted_id
+        return result
+
+
+class MemoryDB:
+    def __init__(self):
+        self._collections = defaultdict(lambda: None)
+
+    def __getitem__(self, name):
+        if self._collections[name] is None:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    @property
+    def calls(self):
+        return sum(c.calls for c in self._collections.values() if c is not None)
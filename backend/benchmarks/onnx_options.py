@@ -0,0 +1,106 @@
+"""
+Throughput of the face pipeline under different ONNX Runtime session options.
+
+    python -m benchmarks.onnx_options --images group_photos --threads 1 2 4 --concurrency 2
+
+For every combination of intra-op threads, graph optimisation level and
+execution mode, the model is loaded with those options and `concurrency`
+threads (think INFERENCE_SLOTS) run model.get() over the sample frames in
+parallel. Reports frames/s and mean latency per setting on this host, so the
+ONNX_* defaults can be checked against the actual core count. The gate that
+caps concurrent model calls at INFERENCE_SLOTS * INFERENCE_FANOUT in the app
+is set to `concurrency` for the run, so every requested caller really runs.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.pipeline_modules import load_frames
+from utils.model_loader import (
+    FACE_MODULES, INFERENCE_FANOUT, INFERENCE_SLOTS, load_model, onnx_config, parse_modules, session_options,
+    set_inference_gate
+)
+
+
+def run_setting(config, frames, repeat, concurrency, modules):
+    model = load_model(parse_modules(modules), options=session_options(config))
+    model.get(frames[0])  # warm-up
+
+    def work(_):
+        latencies = []
+        for _ in range(repeat):
+            for img in frames:
+                start = time.perf_counter()
+                model.get(img)
+                latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [lat for result in pool.map(work, range(concurrency)) for lat in result]
+    elapsed = time.perf_counter() - start
+
+    row = {
+        **config,
+        "concurrency": concurrency,
+        "frames": len(latencies),
+        "frames_per_s": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(float(np.mean(latencies)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2)
+    }
+    print(
+        f"intra={config['intra_threads']:>2} inter={config['inter_threads']} opt={config['graph_opt']:<8} "
+        f"mode={config['execution_mode']:<10} arena={int(config['mem_arena'])} x{concurrency}: "
+        f"{row['frames_per_s']:7.2f} frames/s  mean {row['mean_ms']:8.2f} ms  p95 {row['p95_ms']:8.2f} ms"
+    )
+    return row
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="group_photos", help="folder of sample frames")
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, max(1, cpus // 2), cpus}))
+    parser.add_argument("--graph-opt", nargs="+", default=["all"], choices=["disabled", "basic", "extended", "all"])
+    parser.add_argument("--modes", nargs="+", default=["sequential"], choices=["sequential", "parallel"])
+    parser.add_argument("--no-arena", action="store_true", help="also disable the CPU memory arena")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel callers, e.g. INFERENCE_SLOTS")
+    parser.add_argument("--modules", default=FACE_MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-side", type=int, default=1280)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.max_side)
+    if not frames:
+        parser.error(f"no readable images in {args.images}")
+
+    print(f"{cpus} CPUs, env defaults: {onnx_config()}")
+    # Each caller makes one model call at a time, so a gate of `concurrency` never holds one back
+    set_inference_gate(args.concurrency)
+    if args.concurrency > INFERENCE_SLOTS * INFERENCE_FANOUT:
+        print(f"Note: the app caps concurrent model calls at {INFERENCE_SLOTS * INFERENCE_FANOUT} "
+              f"(INFERENCE_SLOTS * INFERENCE_FANOUT); this run allows {args.concurrency}")
+    results = []
+    for threads in args.threads:
+        for graph_opt in args.graph_opt:
+            for mode in args.modes:
+                config = onnx_config(intra_threads=threads, graph_opt=graph_opt, execution_mode=mode,
+                                     mem_arena=False if args.no_arena else None)
+                results.append(run_setting(config, frames, args.repeat, args.concurrency, args.modules))
+
+    best = max(results, key=lambda r: r["frames_per_s"])
+    print(f"Best: intra={best['intra_threads']} opt={best['graph_opt']} mode={best['execution_mode']} "
+          f"({best['frames_per_s']} frames/s)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {len(results)} rows to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Stage-by-stage benchmark of the frame, live and group recognition paths.
+
+    python -m benchmarks.pipeline --images group_photos --gallery 5000 --json results.json
+    python -m benchmarks.pipeline --synthetic-faces 40 --gallery 50000     # no model needed
+
+Builds a synthetic gallery of the requested size (plus a matching roster in
+an in-memory Mongo stand-in), then replays requests through the same helpers
+the routes use and times every stage separately:
+
+  decode   cv2.imdecode of the uploaded bytes
+  detect   face detection (tiled for large photos)
+  embed    aligned, batched ArcFace
+  match    FaceMatcher.identify against the section partition + fallback
+  db       roster / absent lookups and the attendance bulk upsert
+  report   Excel workbook generation
+
+frame = one webcam-sized image per request, no persistence; live = all
+images downscaled to webcam size in one request, with persistence; group =
+all images at full resolution in one request, with persistence. With
+--synthetic-faces the model stages are skipped and each request matches that
+many synthetic face embeddings instead. Results are JSON so runs can be
+diffed.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+
+from benchmarks.memory_db import MemoryDB
+from benchmarks.synthetic import make_gallery, make_queries
+from utils.attendance_records import save_attendance_records
+from utils.face_matcher import ARC_THRESHOLD, FaceMatcher
+from utils.roster import SectionRoster
+from utils.student_data import StudentGallery, get_partition_rows
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+CLASS_SECTION = "Benchmark (AIML-B)"
+SECTIONS = ("A", "B", "C", "D")
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append((time.perf_counter() - start) * 1000)
+
+    def summary(self):
+        return {
+            name: {
+                "count": len(values),
+                "mean_ms": round(float(np.mean(values)), 3),
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3)
+            }
+            for name, values in self.samples.items()
+        }
+
+
+def build_gallery(size, db):
+    encodings = make_gallery(size)
+    rolls = [f"R{i:06d}" for i in range(size)]
+    names = [f"Student {i}" for i in range(size)]
+    departments = ["AIML"] * size
+    sections = [SECTIONS[i % len(SECTIONS)] for i in range(size)]
+    db["students"].insert_many([
+        {"rollNo": r, "name": n, "department": d, "section": s}
+        for r, n, d, s in zip(rolls, names, departments, sections)
+    ])
+    gallery = StudentGallery().load(names, rolls, departments, sections, encodings)
+    return gallery, encodings
+
+
+def load_uploads(directory, max_side=None):
+    """Encoded image bytes, optionally re-encoded at webcam size."""
+    import cv2
+
+    uploads = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(directory, name), "rb") as f:
+            data = f.read()
+        if max_side:
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            scale = max_side / max(img.shape[:2])
+            if scale < 1:
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            data = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        uploads.append(data)
+    return uploads
+
+
+def embed_uploads(uploads, model, timer):
+    """decode -> detect -> embed, each stage over all uploads, like get_faces_from_uploads."""
+    from utils.face_pipeline import _image_pool, decode_image, detect_faces, embed_faces
+
+    with timer.stage("decode"):
+        images = [img for img in _image_pool.map(decode_image, uploads) if img is not None]
+    with timer.stage("detect"):
+        face_sets = list(_image_pool.map(lambda img: detect_faces(img, model), images))
+    with timer.stage("embed"):
+        items = [(img, face) for img, faces in zip(images, face_sets) for face in faces]
+        embed_faces(items, model)
+    return [face.embedding for _, face in items]
+
+
+def persist(db, attendance, class_section, timer):
+    """Absent computation, attendance upserts and the Excel report, as the live/group routes do."""
+    date_str = datetime.now().strftime("%Y-%m-%d")
+    with timer.stage("db"):
+        roster = SectionRoster.load(db["students"], class_section)
+        absent_rolls = roster.absent_rolls(attendance.keys())
+        records = roster.records(attendance, absent_rolls, date=date_str, type="benchmark")
+        save_attendance_records(db["attendance"], records)
+
+    with timer.stage("report"):
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+        ws_p = wb.create_sheet("Present")
+        ws_p.append(["Roll No", "Name", "Time"])
+        for roll in sorted(attendance):
+            ws_p.append([roll, attendance[roll]["name"], attendance[roll]["time"]])
+        ws_a = wb.create_sheet("Absent")
+        ws_a.append(["Roll No", "Name"])
+        for roll in absent_rolls:
+            ws_a.append([roll, roster.name(roll)])
+        wb.save(io.BytesIO())
+    return len(absent_rolls)
+
+
+def match(matcher, embeddings, partition_rows, timer):
+    with timer.stage("match"):
+        results = matcher.identify(embeddings, threshold=ARC_THRESHOLD, rows=partition_rows)
+    attendance = {}
+    for result in results:
+        if result["roll"] is not None and result["roll"] not in attendance:
+            attendance[result["roll"]] = {"name": result["name"], "time": datetime.now().strftime("%H:%M:%S")}
+    return attendance
+
+
+def run_path(path, requests, gallery, db, model, repeat):
+    matcher = FaceMatcher(gallery)
+    partition_rows = get_partition_rows(gallery, "AIML-B")
+    timer = StageTimer()
+    faces = 0
+    db_calls = []
+    for _ in range(repeat):
+        for request_inputs in requests:
+            start = time.perf_counter()
+            if model is None:
+                embeddings = request_inputs
+            else:
+                embeddings = embed_uploads(request_inputs, model, timer)
+            faces += len(embeddings)
+            attendance = match(matcher, embeddings, partition_rows, timer)
+            if path != "frame":
+                calls_before = db.calls
+                persist(db, attendance, CLASS_SECTION, timer)
+                db_calls.append(db.calls - calls_before)
+            timer.samples["total"].append((time.perf_counter() - start) * 1000)
+
+    summary = timer.summary()
+    row = {"requests": len(timer.samples["total"]), "faces": faces, "stages": summary}
+    if db_calls:
+        row["db_calls_per_request"] = round(float(np.mean(db_calls)), 1)
+    stages = "  ".join(f"{k} {v['mean_ms']:.1f}" for k, v in summary.items() if k != "total")
+    print(f"{path:>6}: {summary['total']['mean_ms']:9.2f} ms/request  ({stages})")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="group_photos", help="folder of sample images")
+    parser.add_argument("--gallery", type=int, default=5000, help="synthetic gallery size")
+    parser.add_argument("--paths", nargs="+", default=["frame", "live", "group"], choices=["frame", "live", "group"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--frame-side", type=int, default=1280, help="webcam-like size for frame/live")
+    parser.add_argument("--synthetic-faces", type=int, default=0, help="skip the model: faces per request")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    db = MemoryDB()
+    gallery, encodings = build_gallery(args.gallery, db)
+    model = None
+    if args.synthetic_faces:
+        queries, _ = make_queries(encodings, args.synthetic_faces * 4)
+        batches = [list(queries[i::4]) for i in range(4)]
+        inputs = {path: batches for path in args.paths}
+    else:
+        from utils.model_loader import get_model
+        model = get_model()
+        frames = load_uploads(args.images, args.frame_side)
+        if not frames:
+            parser.error(f"no readable images in {args.images}")
+        inputs = {
+            "frame": [[frame] for frame in frames],
+            "live": [frames],
+            "group": [load_uploads(args.images)]
+        }
+
+    results = {
+        "host": {"cpus": os.cpu_count(), "platform": platform.platform()},
+        "config": vars(args),
+        "paths": {}
+    }
+    for path in args.paths:
+        results["paths"][path] = run_path(path, inputs[path], gallery, db, model, args.repeat)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
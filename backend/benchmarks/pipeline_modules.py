@@ -0,0 +1,95 @@
+"""
+Full vs trimmed FaceAnalysis pipeline on sample frames.
+
+    python -m benchmarks.pipeline_modules --images group_photos --repeat 5
+
+Loads buffalo_s twice, once with every module and once with the configured
+set (FACE_MODULES, default detection+recognition), runs model.get() on every
+frame and reports the per-frame latency of each pipeline plus the per-module
+breakdown, so a change that brings the extra modules back shows up here.
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from utils.model_loader import FACE_MODULES, load_model, module_timings, parse_modules
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_frames(directory, max_side):
+    frames = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        img = cv2.imread(os.path.join(directory, name))
+        if img is None:
+            continue
+        scale = max_side / max(img.shape[:2])
+        if scale < 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        frames.append(img)
+    return frames
+
+
+def run_pipeline(label, modules, frames, repeat, warmup):
+    model = load_model(modules)
+    for img in frames[:warmup]:
+        model.get(img)
+    module_timings(reset=True)
+
+    latencies = []
+    faces = 0
+    for _ in range(repeat):
+        for img in frames:
+            start = time.perf_counter()
+            faces += len(model.get(img))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies = np.array(latencies)
+    row = {
+        "pipeline": label,
+        "modules": sorted(model.models.keys()),
+        "frames": len(latencies),
+        "faces_per_frame": round(faces / max(1, len(latencies)), 2),
+        "mean_ms": round(float(latencies.mean()), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "per_module": module_timings(reset=True)
+    }
+    print(f"{label:>8}: {row['mean_ms']:8.2f} ms/frame (p95 {row['p95_ms']:.2f}) modules={row['modules']}")
+    for module, stats in row["per_module"].items():
+        print(f"          {module:<16} {stats['calls']:>6} calls  {stats['mean_ms']:8.3f} ms/call")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="group_photos", help="folder of sample frames")
+    parser.add_argument("--modules", default=FACE_MODULES, help="trimmed module set (comma separated)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--max-side", type=int, default=1280, help="downscale frames to webcam-like size")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.max_side)
+    if not frames:
+        parser.error(f"no readable images in {args.images}")
+
+    results = [
+        run_pipeline("full", None, frames, args.repeat, args.warmup),
+        run_pipeline("trimmed", parse_modules(args.modules), frames, args.repeat, args.warmup)
+    ]
+    print(f"Trimmed pipeline speedup: x{results[0]['mean_ms'] / results[1]['mean_ms']:.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {len(results)} rows to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
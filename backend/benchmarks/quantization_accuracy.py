@@ -0,0 +1,248 @@
+"""
+INT8 vs FP32 accuracy on a labelled photo set.
+
+    python -m benchmarks.quantization_accuracy --photos labelled --int8 buffalo_s_int8
+    python -m benchmarks.quantization_accuracy --photos labelled --int8 buffalo_s_int8 --mark-compatible
+
+The photo set is one folder per person (photos/<roll or name>/*.jpg); the
+largest face of every image is used. For the FP32 and the INT8 pack it
+reports:
+
+  drift      cosine similarity between the FP32 and INT8 embedding of the same image
+  genuine    similarity distribution of same-person pairs, and the share >= threshold
+  impostor   similarity distribution of different-person pairs, and the share >= threshold
+  decisions  first image per person is the gallery, the rest are probes; top-1
+             accuracy per pack and the share of probes with the same match /
+             no-match decision in both packs
+  cross      INT8 probes against the FP32 gallery, i.e. what production sees
+             right after a pack switch before anyone re-registers: top-1,
+             agreement with the FP32-only decisions, and how far the genuine /
+             impostor accept rates at the threshold move from FP32's
+
+Exits with status 1 when decision agreement or mean drift fall below the
+given tolerances, so the INT8 pack is only adopted where it holds up. The
+cross check decides whether adopting it needs re-enrollment: with
+--mark-compatible a passing pack gets the FP32 embedding version in its
+manifest (see utils.model_packs), so the gallery keeps every enrolled
+student after the switch; a failing one is left as is and only matches
+students registered with it.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from utils.face_matcher import ARC_THRESHOLD
+from utils.model_loader import load_model
+from utils.model_packs import PACK_MANIFEST, pack_dir, read_manifest, recognition_version
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_photo_set(directory):
+    """Returns [(label, image)] for photos/<label>/*.jpg."""
+    photos = []
+    for label in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                img = cv2.imread(os.path.join(folder, name))
+                if img is not None:
+                    photos.append((label, img))
+    return photos
+
+
+def embed_photos(pack, photos):
+    """Largest-face embedding (unit length) per photo, NaN rows where no face is found."""
+    model = load_model(["detection", "recognition"], pack=pack)
+    embeddings = np.full((len(photos), 512), np.nan, dtype=np.float32)
+    start = time.perf_counter()
+    for i, (_, img) in enumerate(photos):
+        faces = model.get(img)
+        if not faces:
+            continue
+        face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+        embeddings[i] = face.embedding / np.linalg.norm(face.embedding)
+    ms_per_photo = (time.perf_counter() - start) * 1000 / max(1, len(photos))
+    return embeddings, ms_per_photo
+
+
+def _summary(values):
+    if values.size == 0:
+        return None
+    return {
+        "mean": round(float(values.mean()), 4),
+        "std": round(float(values.std()), 4),
+        "p5": round(float(np.percentile(values, 5)), 4),
+        "p95": round(float(np.percentile(values, 95)), 4)
+    }
+
+
+def pair_distributions(embeddings, labels, threshold):
+    valid = ~np.isnan(embeddings[:, 0])
+    emb, lab = embeddings[valid], labels[valid]
+    sims = emb @ emb.T
+    upper = np.triu(np.ones_like(sims, dtype=bool), k=1)
+    same = lab[:, None] == lab[None, :]
+    genuine, impostor = sims[upper & same], sims[upper & ~same]
+    return {
+        "genuine": _summary(genuine),
+        "impostor": _summary(impostor),
+        "genuine_accept": round(float(np.mean(genuine >= threshold)), 4) if genuine.size else None,
+        "impostor_accept": round(float(np.mean(impostor >= threshold)), 4) if impostor.size else None
+    }
+
+
+def _enroll(embeddings, labels):
+    """First photo per label is enrolled, the rest are probes. Returns ({label: idx}, [probe idx])."""
+    gallery, probes = {}, []
+    for i, label in enumerate(labels):
+        if np.isnan(embeddings[i, 0]):
+            continue
+        if label in gallery:
+            probes.append(i)
+        else:
+            gallery[label] = i
+    return gallery, probes
+
+
+def identify(embeddings, labels, threshold, probe_embeddings=None):
+    """
+    Matches the probes against the enrolled photos. probe_embeddings (e.g.
+    the other pack's) replaces the probe vectors, the gallery stays.
+    Returns (probe idx, predicted labels, genuine sims, impostor sims).
+    """
+    gallery, probes = _enroll(embeddings, labels)
+    if probe_embeddings is not None:
+        probes = [i for i in probes if not np.isnan(probe_embeddings[i, 0])]
+    else:
+        probe_embeddings = embeddings
+    names = list(gallery)
+    matrix = embeddings[[gallery[n] for n in names]]
+    predicted, genuine, impostor = [], [], []
+    for i in probes:
+        sims = matrix @ probe_embeddings[i]
+        best = int(np.argmax(sims))
+        predicted.append(names[best] if sims[best] >= threshold else None)
+        same = np.array([n == labels[i] for n in names])
+        genuine.extend(sims[same])
+        impostor.extend(sims[~same])
+    return probes, predicted, np.array(genuine), np.array(impostor)
+
+
+def cross_precision(fp32, int8, labels, threshold):
+    """INT8 probes against the FP32 gallery, compared with FP32 probes against it."""
+    base_probes, base_predicted, base_genuine, base_impostor = identify(fp32, labels, threshold)
+    probes, predicted, genuine, impostor = identify(fp32, labels, threshold, probe_embeddings=int8)
+    base = dict(zip(base_probes, base_predicted))
+    shared = [(i, p) for i, p in zip(probes, predicted) if i in base]
+
+    def accept(values):
+        return float(np.mean(values >= threshold)) if values.size else 0.0
+
+    return {
+        "probes": len(probes),
+        "top1_accuracy": round(float(np.mean([labels[i] == p for i, p in zip(probes, predicted)])), 4) if probes else None,
+        "decision_agreement": round(float(np.mean([base[i] == p for i, p in shared])), 4) if shared else 0.0,
+        "genuine": _summary(genuine),
+        "impostor": _summary(impostor),
+        # Positive: INT8 probes score lower against FP32 enrolments than FP32 probes do
+        "genuine_mean_drop": round(float(base_genuine.mean() - genuine.mean()), 4) if genuine.size else None,
+        "genuine_accept_drift": round(accept(genuine) - accept(base_genuine), 4),
+        "impostor_accept_drift": round(accept(impostor) - accept(base_impostor), 4)
+    }
+
+
+def mark_compatible(int8_pack, fp32_pack, cross):
+    """Stores the FP32 embedding version in the INT8 pack's manifest."""
+    manifest = read_manifest(int8_pack)
+    manifest.update({"recognition": recognition_version(fp32_pack), "cross_precision": cross})
+    with open(os.path.join(pack_dir(int8_pack), PACK_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", required=True, help="labelled photo folder: <label>/*.jpg")
+    parser.add_argument("--fp32", default="buffalo_s")
+    parser.add_argument("--int8", default="buffalo_s_int8")
+    parser.add_argument("--threshold", type=float, default=ARC_THRESHOLD)
+    parser.add_argument("--min-agreement", type=float, default=0.99, help="required share of identical decisions")
+    parser.add_argument("--min-similarity", type=float, default=0.98, help="required mean FP32/INT8 cosine")
+    parser.add_argument("--max-accept-drift", type=float, default=0.01,
+                        help="allowed change of the genuine / impostor accept rates, INT8 probes vs FP32 gallery")
+    parser.add_argument("--mark-compatible", action="store_true",
+                        help="if the cross check passes, keep the FP32 embedding version in the INT8 pack's manifest")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    photos = load_photo_set(args.photos)
+    if not photos:
+        parser.error(f"no labelled photos in {args.photos}")
+    labels = np.array([label for label, _ in photos])
+
+    report = {"photos": len(photos), "people": int(len(set(labels))), "threshold": args.threshold, "packs": {}}
+    embeddings, predictions = {}, {}
+    for pack in (args.fp32, args.int8):
+        emb, ms = embed_photos(pack, photos)
+        probes, predicted, _, _ = identify(emb, labels, args.threshold)
+        embeddings[pack] = emb
+        predictions[pack] = dict(zip(probes, predicted))
+        report["packs"][pack] = {
+            "faces_found": int((~np.isnan(emb[:, 0])).sum()),
+            "ms_per_photo": round(ms, 2),
+            "top1_accuracy": round(float(np.mean([labels[i] == p for i, p in zip(probes, predicted)])), 4) if probes else None,
+            **pair_distributions(emb, labels, args.threshold)
+        }
+
+    both = ~np.isnan(embeddings[args.fp32][:, 0]) & ~np.isnan(embeddings[args.int8][:, 0])
+    drift = np.sum(embeddings[args.fp32][both] * embeddings[args.int8][both], axis=1)
+    shared = sorted(set(predictions[args.fp32]) & set(predictions[args.int8]))
+    agreement = float(np.mean([predictions[args.fp32][i] == predictions[args.int8][i] for i in shared])) if shared else 0.0
+    report["drift"] = _summary(drift)
+    report["decision_agreement"] = round(agreement, 4)
+    cross = report["cross"] = cross_precision(embeddings[args.fp32], embeddings[args.int8], labels, args.threshold)
+
+    for pack, stats in report["packs"].items():
+        print(f"{pack:>16}: faces {stats['faces_found']}/{len(photos)}  top-1 {stats['top1_accuracy']}  "
+              f"genuine>=thr {stats['genuine_accept']}  impostor>=thr {stats['impostor_accept']}  "
+              f"{stats['ms_per_photo']} ms/photo")
+    print(f"FP32 vs INT8 cosine: {report['drift']}")
+    print(f"Decision agreement: {agreement:.4f} over {len(shared)} probes")
+    print(f"INT8 probes vs FP32 gallery: top-1 {cross['top1_accuracy']}  agreement {cross['decision_agreement']} "
+          f"over {cross['probes']} probes  genuine mean drop {cross['genuine_mean_drop']}  "
+          f"accept drift genuine {cross['genuine_accept_drift']} impostor {cross['impostor_accept_drift']}")
+
+    mean_drift = report["drift"]["mean"] if report["drift"] else 0.0
+    within = agreement >= args.min_agreement and mean_drift >= args.min_similarity
+    compatible = within and cross["decision_agreement"] >= args.min_agreement \
+        and abs(cross["genuine_accept_drift"]) <= args.max_accept_drift \
+        and abs(cross["impostor_accept_drift"]) <= args.max_accept_drift
+    report["within_tolerance"], report["cross_compatible"] = within, compatible
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.json}")
+
+    if not within:
+        print("INT8 pack is OUTSIDE tolerance")
+        sys.exit(1)
+    print("INT8 pack is within tolerance")
+    if not compatible:
+        print(f"INT8 probes do NOT match the FP32 gallery: adopting {args.int8} needs every student to re-register")
+        return
+    print(f"INT8 probes match the FP32 gallery: {args.int8} can be adopted without re-enrollment")
+    if args.mark_compatible:
+        mark_compatible(args.int8, args.fp32, cross)
+        print(f"Marked {args.int8} as embedding version {recognition_version(args.fp32)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import numpy as np
+
+from utils.face_matcher import normalize_rows
+
+EMBEDDING_DIM = 512
+
+
+def make_gallery(size, dim=EMBEDDING_DIM, clusters=64, cluster_weight=0.4, seed=0):
+    """
+    Unit-length encodings with some shared structure, so that coarse
+    quantisation behaves more like real ArcFace galleries than pure noise.
+    """
+    rng = np.random.default_rng(seed)
+    centers = normalize_rows(rng.normal(size=(clusters, dim)))
+    members = rng.integers(0, clusters, size=size)
+    own = normalize_rows(rng.normal(size=(size, dim)))
+    return normalize_rows(cluster_weight * centers[members] + own)
+
+
+def make_queries(gallery, count, genuine_sim=0.6, impostor_rate=0.2, seed=1):
+    """
+    Returns (queries, truth). Genuine queries are noisy copies of a gallery
+    row with roughly genuine_sim cosine to it; impostors are fresh vectors
+    with truth -1.
+    """
+    rng = np.random.default_rng(seed)
+    dim = gallery.shape[1]
+    truth = rng.integers(0, gallery.shape[0], size=count)
+    truth[rng.random(count) < impostor_rate] = -1
+
+    # cos(g, g + n) ~= 1 / sqrt(1 + dim * s^2) for unit g and per-dim noise s
+    noise_std = np.sqrt((1.0 / genuine_sim ** 2 - 1.0) / dim)
+    queries = np.empty((count, dim), dtype=np.float32)
+    genuine = truth >= 0
+    queries[genuine] = gallery[truth[genuine]] + rng.normal(scale=noise_std, size=(genuine.sum(), dim))
+    queries[~genuine] = rng.normal(size=((~genuine).sum(), dim))
+    return normalize_rows(queries), truth
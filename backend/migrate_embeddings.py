@@ -0,0 +1,71 @@
+from pymongo import MongoClient, UpdateOne, ReplaceOne
+import argparse
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+
+from utils.embedding_codec import (
+    EMBEDDING_DTYPE, EMBEDDING_DTYPES, EMBEDDINGS_COLLECTION, LEGACY_MODEL_VERSION,
+    build_embedding_doc, decode_embedding
+)
+
+load_dotenv()
+
+BATCH_SIZE = 500
+
+def migrate_embeddings(dtype=EMBEDDING_DTYPE, dry_run=False):
+    """
+    Moves face_encoding out of student documents into the embeddings
+    collection as packed little-endian BinData, then unsets it on the
+    student. Both legacy formats (array of doubles, packed BinData) are
+    accepted. The embedding is written before the student is touched, so
+    the command can be interrupted and re-run safely.
+    """
+    client = MongoClient(os.getenv("MONGO_URI"))
+    db = client["AttendanceDB"]
+    students_col = db["students"]
+    embeddings_col = db[EMBEDDINGS_COLLECTION]
+
+    legacy = {"face_encoding": {"$exists": True}}
+    total = students_col.count_documents(legacy)
+    print(f"{total} student(s) still carry face_encoding, target dtype {dtype}")
+    if dry_run or total == 0:
+        return
+
+    fields = {"rollNo": 1, "face_encoding": 1, "face_encoding_dtype": 1, "registeredAt": 1}
+    embedding_ops, student_ops, migrated = [], [], 0
+
+    def flush():
+        nonlocal migrated
+        embeddings_col.bulk_write(embedding_ops, ordered=False)
+        migrated += students_col.bulk_write(student_ops, ordered=False).modified_count
+        embedding_ops.clear()
+        student_ops.clear()
+        print(f"  migrated {migrated}/{total}")
+
+    for doc in students_col.find(legacy, fields):
+        roll = str(doc["rollNo"])
+        vector = decode_embedding(doc["face_encoding"], doc.get("face_encoding_dtype"))
+        # Encodings on student documents predate other packs
+        embedding_doc = build_embedding_doc(
+            roll, vector, doc.get("registeredAt") or datetime.utcnow(), dtype, LEGACY_MODEL_VERSION
+        )
+        embedding_ops.append(ReplaceOne({"rollNo": roll}, embedding_doc, upsert=True))
+        student_ops.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$unset": {"face_encoding": "", "face_encoding_dtype": ""}}
+        ))
+        if len(embedding_ops) == BATCH_SIZE:
+            flush()
+    if embedding_ops:
+        flush()
+
+    print(f"Moved {migrated} embedding(s) to '{EMBEDDINGS_COLLECTION}' as packed {dtype}")
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move face encodings into the embeddings collection as packed binary")
+    parser.add_argument("--dtype", choices=sorted(EMBEDDING_DTYPES), default=EMBEDDING_DTYPE)
+    parser.add_argument("--dry-run", action="store_true", help="only count students still carrying face_encoding")
+    args = parser.parse_args()
+    migrate_embeddings(args.dtype, args.dry_run)
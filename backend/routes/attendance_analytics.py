@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from utils.roster import ROSTER_FIELDS
 import os
 from datetime import datetime, timedelta
 
@@ -25,7 +26,7 @@ def get_student_analytics(roll_no):
     """
     try:
         # Get student info
-        student = students_col.find_one({"rollNo": roll_no})
+        student = students_col.find_one({"rollNo": roll_no}, ROSTER_FIELDS)
         if not student:
             return jsonify({"error": "Student not found"}), 404
 
@@ -178,11 +179,11 @@ def get_class_analytics(class_name):
              sec = section_param
 
         if dept and sec:
-            students = list(students_col.find({"department": dept, "section": sec}))
+            students = list(students_col.find({"department": dept, "section": sec}, ROSTER_FIELDS))
             if not students:
-                 students = list(students_col.find({"department": {"$regex": f"^{dept}", "$options": "i"}, "section": sec}))
+                 students = list(students_col.find({"department": {"$regex": f"^{dept}", "$options": "i"}, "section": sec}, ROSTER_FIELDS))
         elif sec:
-            students = list(students_col.find({"section": sec}))
+            students = list(students_col.find({"section": sec}, ROSTER_FIELDS))
         
         # Fallback: Who has attended?
         if not students:
@@ -191,7 +192,7 @@ def get_class_analytics(class_name):
                 "className": {"$regex": section_param, "$options": "i"} if section_param else {"$exists": True}
             })
             if roll_nos:
-                students = list(students_col.find({"rollNo": {"$in": roll_nos}}))
+                students = list(students_col.find({"rollNo": {"$in": roll_nos}}, ROSTER_FIELDS))
 
         # 2. Get TOTAL CLASSES conducted
         # Count unique dates for this subject & section
@@ -280,10 +281,10 @@ def get_subject_analytics(subject, class_name):
         else:
             query = {"section": section_code}
         
-        students = list(students_col.find(query))
+        students = list(students_col.find(query, ROSTER_FIELDS))
         
         if not students:
-            students = list(students_col.find({"section": section_code}))
+            students = list(students_col.find({"section": section_code}, ROSTER_FIELDS))
 
         subject_analytics = []
         total_percentage_sum = 0
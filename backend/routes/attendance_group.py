@@ -1,14 +1,11 @@
-import cv2
-import numpy as np
 import insightface
 import openpyxl
 import gridfs
 import os
-import shutil
+import time
 from pymongo import MongoClient
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-from numpy.linalg import norm
 from dotenv import load_dotenv
 
 from routes.jwt_middleware import token_required
@@ -25,7 +22,6 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 
 ARC_THRESHOLD = 0.38
-GROUP_PHOTOS_DIR = "group_photos"
 
 # ---------------- DB ----------------
 client = MongoClient(MONGO_URI)
@@ -35,7 +31,13 @@ fs = gridfs.GridFS(db)
 
 # ---------------- MODEL ----------------
 from utils.model_loader import get_model
-from utils.student_data import get_student_data
+from utils.student_data import get_student_data, get_partition_rows
+from utils.face_matcher import FaceMatcher
+from utils.face_pipeline import get_faces_from_uploads
+from utils.roster import SectionRoster
+from utils.inference_pool import inference_pool
+from utils.attendance_records import save_attendance_records
+from utils.metrics import RequestTimer, elapsed_ms, timings_requested
 model = get_model()
 
 # ---------------- GROUP ATTENDANCE ----------------
@@ -43,12 +45,12 @@ model = get_model()
 @token_required
 def group_attendance():
     teacher = request.teacher
+    timer = RequestTimer("group")
     
     # Load singleton data
-    data = get_student_data()
-    names = data["names"]
-    rolls = data["rolls"]
-    encodings = data["encodings"]
+    with timer.stage("gallery"):
+        data = get_student_data()
+        matcher = FaceMatcher(data)
 
     # -------- Metadata --------
     course = request.form.get("course", "COURSE")
@@ -56,64 +58,41 @@ def group_attendance():
     hour = request.form.get("hour", "HOUR")
     report_type = request.form.get("report_type", "both")
     date_str = datetime.now().strftime("%Y-%m-%d")
+    partition_rows = get_partition_rows(data, class_section)
     
-    # Clear existing photos to ensure fresh processing
-    if os.path.exists(GROUP_PHOTOS_DIR):
-        shutil.rmtree(GROUP_PHOTOS_DIR)
-    os.makedirs(GROUP_PHOTOS_DIR, exist_ok=True)
-
-    # Save uploaded photos
-    photos = request.files.getlist('photos')
-    for photo in photos:
-        if photo:
-            photo.save(os.path.join(GROUP_PHOTOS_DIR, photo.filename))
-    
-    attendance = {}
+    # Read uploads in memory: no shared directory, concurrent sessions stay isolated
+    photos = [photo.read() for photo in request.files.getlist('photos') if photo]
 
-    for img_name in os.listdir(GROUP_PHOTOS_DIR):
-        img_path = os.path.join(GROUP_PHOTOS_DIR, img_name)
-        img = cv2.imread(img_path)
-        if img is None:
-            continue
-
-        faces = model.get(img)
-        for face in faces:
-            emb = face.embedding / norm(face.embedding)
-            
-            if encodings.shape[0] > 0:
-                sims = np.dot(emb, encodings)
-                idx = int(np.argmax(sims))
-
-                if sims[idx] >= ARC_THRESHOLD:
-                    roll = rolls[idx]
-                    if roll not in attendance:
-                        attendance[roll] = {
-                            "name": names[idx],
-                            "time": datetime.now().strftime("%H:%M:%S")
-                        }
+    attendance = {}
+    embeddings = []
+
+    # Decode + detect + embed every photo in parallel, then merge the face sets
+    face_sets, timings = inference_pool.run(get_faces_from_uploads, photos, model, timer=timer)
+    timer.add("queue", timings["queue_ms"])
+    for faces in face_sets:
+        if faces:
+            embeddings.extend(face.embedding for face in faces)
+
+    # Match faces from every photo in one pass
+    with timer.stage("match"):
+        results = matcher.identify(embeddings, threshold=ARC_THRESHOLD, rows=partition_rows)
+    for result in results:
+        roll = result["roll"]
+        if roll is not None and roll not in attendance:
+            attendance[roll] = {
+                "name": result["name"],
+                "time": datetime.now().strftime("%H:%M:%S")
+            }
 
     # -------- Absent Logic --------
-    query = {}
-    if "-" in class_section:
-        import re
-        match = re.search(r'\((.*?)\)', class_section)
-        sec_code = match.group(1) if match else class_section
-        dept, sec = sec_code.split("-", 1)
-        query = {"department": dept, "section": sec}
-    else:
-        query = {"section": class_section}
-    
-    section_students = list(students_col.find(query))
-    if not section_students and "(" in class_section:
-        import re
-        match = re.search(r'\((.*?)\)', class_section)
-        sec_code = match.group(1) if match else class_section
-        section_students = list(students_col.find({"section": sec_code}))
-
-    section_rolls = {str(s["rollNo"]) for s in section_students}
-    absent_rolls = sorted(section_rolls - set(attendance.keys()))
+    step_start = time.perf_counter()
+    # One projected roster read serves the absent list, the records and the report
+    roster = SectionRoster.load(students_col, class_section)
+    absent_rolls = roster.absent_rolls(attendance.keys())
+    timer.add("db", elapsed_ms(step_start))
 
     # -------- Excel --------
+    step_start = time.perf_counter()
     # Sanitize inputs for filename
     import re
     safe_course = re.sub(r'[^a-zA-Z0-9.\-]', '_', course)
@@ -137,13 +116,15 @@ def group_attendance():
 
     if report_type in ("absent", "both"):
         ws_a = wb.create_sheet("Absent")
-        ws_a.append(["Roll No"])
+        ws_a.append(["Roll No", "Name"])
         for r in absent_rolls:
-            ws_a.append([r])
+            ws_a.append([r, roster.name(r)])
 
     wb.save(filename)
+    timer.add("report", elapsed_ms(step_start))
 
     # -------- Store in GridFS --------
+    step_start = time.perf_counter()
     try:
         with open(filename, "rb") as f:
             file_id = fs.put(
@@ -155,68 +136,34 @@ def group_attendance():
         print(f"Group attendance Excel saved to GridFS with ID: {file_id}, filename: {filename}")
 
         # -------- Store in MongoDB Collection (for Dashboard/HOD) --------
-        attendance_records_db = []
-        
-        # 1. Add Present Students
-        for roll, data in attendance.items():
-            record = {
-                "rollNo": roll,
-                "name": data["name"],
-                "date": date_str,
-                "subject": course,
-                "className": class_section,
-                "section": class_section.split("-")[-1].replace(")", "") if "-" in class_section else class_section,
-                "status": "present",
-                "time": data["time"],
-                "type": "group",
-                "facultyId": teacher.get("facultyId"),
-                "facultyName": teacher.get("name"),
-                "timestamp": datetime.utcnow()
-            }
-            attendance_records_db.append(record)
-
-        # 2. Add Absent Students
-        for roll in absent_rolls:
-            student_doc = students_col.find_one({"rollNo": roll})
-            student_name = student_doc["name"] if student_doc else "Unknown"
-            
-            record = {
-                "rollNo": roll,
-                "name": student_name,
-                "date": date_str,
-                "subject": course,
-                "className": class_section,
-                "section": class_section.split("-")[-1].replace(")", "") if "-" in class_section else class_section,
-                "status": "absent",
-                "time": None,
-                "type": "group",
-                "facultyId": teacher.get("facultyId"),
-                "facultyName": teacher.get("name"),
-                "timestamp": datetime.utcnow()
-            }
-            attendance_records_db.append(record)
-
-        if attendance_records_db:
-            # Upsert records
-            for record in attendance_records_db:
-                db["attendance"].update_one(
-                    {
-                        "rollNo": record["rollNo"],
-                        "date": record["date"],
-                        "className": record["className"]
-                    },
-                    {"$set": record},
-                    upsert=True
-                )
-            print(f"Saved {len(attendance_records_db)} records to AttendanceDB.attendance")
+        attendance_records_db = roster.records(
+            attendance, absent_rolls,
+            date=date_str,
+            subject=course,
+            type="group",
+            facultyId=teacher.get("facultyId"),
+            facultyName=teacher.get("name")
+        )
+
+        # One unordered bulk upsert for the whole session, one timestamp for every record
+        saved = save_attendance_records(db["attendance"], attendance_records_db)
+        print(f"Saved {len(attendance_records_db)} records to AttendanceDB.attendance "
+              f"({saved['upserted']} new, {saved['modified']} updated, {saved['failed']} failed)")
     except Exception as e:
         print(f"Error saving Excel to GridFS: {str(e)}")
         return jsonify({"error": f"Failed to save report: {str(e)}"}), 500
+    timer.add("db", elapsed_ms(step_start))
+
+    stage_timings = timer.finish()
+    if timings_requested():
+        timings = {**timings, "stages": stage_timings}
 
     return jsonify({
         "message": "Group attendance completed",
         "filename": filename,
         "present": len(attendance),
         "absent": len(absent_rolls),
-        "present_students": [{"roll": r, "name": attendance[r]["name"], "time": attendance[r]["time"]} for r in sorted(attendance)]
+        "records": saved,
+        "present_students": [{"roll": r, "name": attendance[r]["name"], "time": attendance[r]["time"]} for r in sorted(attendance)],
+        "timings": timings
     }), 200
@@ -1,5 +1,4 @@
 import cv2
-import numpy as np
 import insightface
 import openpyxl
 import gridfs
@@ -8,7 +7,6 @@ import time  # Added for timing
 from pymongo import MongoClient
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-from numpy.linalg import norm
 from dotenv import load_dotenv
 
 from routes.jwt_middleware import token_required
@@ -35,7 +33,14 @@ fs = gridfs.GridFS(db)
 
 # ---------------- MODEL ----------------
 from utils.model_loader import get_model
-from utils.student_data import get_student_data
+from utils.student_data import get_student_data, get_partition_rows
+from utils.face_matcher import FaceMatcher
+from utils.face_pipeline import get_faces, get_faces_from_uploads
+from utils.roster import SectionRoster
+from utils.live_sessions import sessions
+from utils.inference_pool import inference_pool
+from utils.attendance_records import save_attendance_records
+from utils.metrics import RequestTimer, elapsed_ms, timings_requested
 model = get_model()
 
 # ---------------- LIVE ATTENDANCE ----------------
@@ -43,12 +48,12 @@ model = get_model()
 @token_required
 def live_attendance():
     teacher = request.teacher
+    timer = RequestTimer("live")
     
     # Load singleton data
-    data = get_student_data()
-    names = data["names"]
-    rolls = data["rolls"]
-    encodings = data["encodings"]
+    with timer.stage("gallery"):
+        data = get_student_data()
+        matcher = FaceMatcher(data)
 
     # -------- Metadata --------
     course = request.form.get("course", "COURSE")
@@ -56,41 +61,21 @@ def live_attendance():
     hour = request.form.get("hour", "HOUR")
     report_type = request.form.get("report_type", "both")  # present | absent | both
     date_str = datetime.now().strftime("%Y-%m-%d")
+    partition_rows = get_partition_rows(data, class_section)
 
     attendance = {}
+    embeddings = []
+    timings = None
 
     # Check if images are provided from frontend
     if 'images' in request.files:
         # Process multiple images from frontend
-        images = request.files.getlist('images')
-        for image_file in images:
-            if image_file.filename == '':
-                continue
-
-            # Read image
-            img_bytes = image_file.read()
-            np_img = np.frombuffer(img_bytes, np.uint8)
-            frame = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-
-            if frame is None:
-                continue
-
-            faces = model.get(frame)
-
-            for face in faces:
-                emb = face.embedding / norm(face.embedding)
-                
-                if encodings.shape[0] > 0:
-                    sims = np.dot(emb, encodings)
-                    idx = int(np.argmax(sims))
-
-                    if sims[idx] >= ARC_THRESHOLD:
-                        roll = rolls[idx]
-                        if roll not in attendance:
-                            attendance[roll] = {
-                                "name": names[idx],
-                                "time": datetime.now().strftime("%H:%M:%S")
-                            }
+        images = [f.read() for f in request.files.getlist('images') if f.filename != '']
+        face_sets, timings = inference_pool.run(get_faces_from_uploads, images, model, timer=timer)
+        timer.add("queue", timings["queue_ms"])
+        for faces in face_sets:
+            if faces:
+                embeddings.extend(face.embedding for face in faces)
     else:
         # Fallback: try server-side camera (for testing)
         try:
@@ -107,55 +92,77 @@ def live_attendance():
                 if not ret:
                     break
 
-                faces = model.get(frame)
-
-                for face in faces:
-                    emb = face.embedding / norm(face.embedding)
-                    
-                    if encodings.shape[0] > 0:
-                        sims = np.dot(emb, encodings)
-                        idx = int(np.argmax(sims))
-
-                        if sims[idx] >= ARC_THRESHOLD:
-                            roll = rolls[idx]
-                            if roll not in attendance:
-                                attendance[roll] = {
-                                    "name": names[idx],
-                                    "time": datetime.now().strftime("%H:%M:%S")
-                                }
+                faces = get_faces(frame, model, timer=timer)
+                embeddings.extend(face.embedding for face in faces)
 
             cap.release()
         except Exception as e:
             return jsonify({"error": f"Camera access failed: {str(e)}"}), 500
 
+    # -------- Match all collected faces in one pass --------
+    with timer.stage("match"):
+        results = matcher.identify(embeddings, threshold=ARC_THRESHOLD, rows=partition_rows)
+    for result in results:
+        roll = result["roll"]
+        if roll is not None and roll not in attendance:
+            attendance[roll] = {
+                "name": result["name"],
+                "time": datetime.now().strftime("%H:%M:%S")
+            }
+
+    return _finalize_attendance(teacher, attendance, course, class_section, hour, report_type, date_str, timer, timings)
+
+
+# ---------------- FINALIZE LIVE SESSION ----------------
+@live_attendance_bp.route("/live/finalize", methods=["POST"])
+@token_required
+def finalize_live_session():
+    """
+    Writes attendance from the rolls a live recognition session accumulated,
+    without running any image through the model again.
+    """
+    teacher = request.teacher
+    timer = RequestTimer("live_finalize")
+    payload = request.form if request.form else (request.get_json(silent=True) or {})
+
+    session = sessions.get(payload.get("session_id"))
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    if not session.teacher or session.teacher.get("email") != teacher.get("email"):
+        return jsonify({"error": "Session belongs to another teacher"}), 403
+
+    course = payload.get("course", "COURSE")
+    class_section = payload.get("class") or session.class_section or "CLASS"
+    hour = payload.get("hour", "HOUR")
+    report_type = payload.get("report_type", "both")  # present | absent | both
+    date_str = datetime.now().strftime("%Y-%m-%d")
+
+    with session.lock:
+        attendance = {
+            roll: {"name": entry["name"], "time": entry["time"]}
+            for roll, entry in session.present.items()
+        }
+
+    response = _finalize_attendance(teacher, attendance, course, class_section, hour, report_type, date_str, timer)
+    if response[1] == 200:
+        sessions.close(session.id)
+    return response
+
+
+def _finalize_attendance(teacher, attendance, course, class_section, hour, report_type, date_str, timer, timings=None):
+    """
+    Absent list, Excel report, GridFS copy and attendance records for a set
+    of present students ({roll: {"name", "time"}}). Returns the response.
+    """
     # -------- Absent Logic --------
-    # Load all expected student rolls for this section
-    query = {}
-    if "-" in class_section:
-        # Check if class_section is like "Java Programming (AIML-B)"
-        # We need to extract "AIML-B"
-        import re
-        match = re.search(r'\((.*?)\)', class_section)
-        sec_code = match.group(1) if match else class_section
-        
-        dept, sec = sec_code.split("-", 1)
-        query = {"department": dept, "section": sec}
-    else:
-        query = {"section": class_section}
-    
-    section_students = list(students_col.find(query))
-    # Fallback if no match
-    if not section_students and "(" in class_section:
-        import re
-        match = re.search(r'\((.*?)\)', class_section)
-        sec_code = match.group(1) if match else class_section
-        section_students = list(students_col.find({"section": sec_code}))
-
-    section_rolls = {str(s["rollNo"]) for s in section_students}
-    present_rolls = set(attendance.keys())
-    absent_rolls = sorted(section_rolls - present_rolls)
+    step_start = time.perf_counter()
+    # One projected roster read serves the absent list, the records and the report
+    roster = SectionRoster.load(students_col, class_section)
+    absent_rolls = roster.absent_rolls(attendance.keys())
+    timer.add("db", elapsed_ms(step_start))
 
     # -------- Excel --------
+    step_start = time.perf_counter()
     # Sanitize inputs for filename
     import re
     safe_course = re.sub(r'[^a-zA-Z0-9.\-]', '_', course)
@@ -179,13 +186,15 @@ def live_attendance():
 
     if report_type in ("absent", "both"):
         ws_a = wb.create_sheet("Absent")
-        ws_a.append(["Roll No"])
+        ws_a.append(["Roll No", "Name"])
         for r in absent_rolls:
-            ws_a.append([r])
+            ws_a.append([r, roster.name(r)])
 
     wb.save(filename)
+    timer.add("report", elapsed_ms(step_start))
 
     # -------- Store in GridFS --------
+    step_start = time.perf_counter()
     print(f"Attempting to save Excel file: {filename}")
     try:
         with open(filename, "rb") as f:
@@ -208,61 +217,19 @@ def live_attendance():
         print(f"Live attendance Excel saved to GridFS with ID: {file_id}, filename: {filename}")
 
         # -------- Store in MongoDB Collection (for Dashboard/HOD) --------
-        attendance_records_db = []
-        
-        # 1. Add Present Students
-        for roll, data in attendance.items():
-            record = {
-                "rollNo": roll,
-                "name": data["name"],
-                "date": date_str,
-                "subject": course,
-                "className": class_section,
-                "section": class_section.split("-")[-1].replace(")", "") if "-" in class_section else class_section,
-                "status": "present",
-                "time": data["time"],
-                "type": "live",
-                "facultyId": teacher.get("facultyId"),
-                "facultyName": teacher.get("name"),
-                "timestamp": datetime.utcnow()
-            }
-            attendance_records_db.append(record)
-
-        # 2. Add Absent Students
-        for roll in absent_rolls:
-            # Find student name from DB if possible, or use placeholder
-            student_doc = students_col.find_one({"rollNo": roll})
-            student_name = student_doc["name"] if student_doc else "Unknown"
-            
-            record = {
-                "rollNo": roll,
-                "name": student_name,
-                "date": date_str,
-                "subject": course,
-                "className": class_section,
-                "section": class_section.split("-")[-1].replace(")", "") if "-" in class_section else class_section,
-                "status": "absent",
-                "time": None,
-                "type": "live",
-                "facultyId": teacher.get("facultyId"),
-                "facultyName": teacher.get("name"),
-                "timestamp": datetime.utcnow()
-            }
-            attendance_records_db.append(record)
-
-        if attendance_records_db:
-            # Upsert records to avoid duplicates if re-processed
-            for record in attendance_records_db:
-                db["attendance"].update_one(
-                    {
-                        "rollNo": record["rollNo"],
-                        "date": record["date"],
-                        "className": record["className"]
-                    },
-                    {"$set": record},
-                    upsert=True
-                )
-            print(f"Saved {len(attendance_records_db)} records to AttendanceDB.attendance")
+        attendance_records_db = roster.records(
+            attendance, absent_rolls,
+            date=date_str,
+            subject=course,
+            type="live",
+            facultyId=teacher.get("facultyId"),
+            facultyName=teacher.get("name")
+        )
+
+        # One unordered bulk upsert for the whole session, one timestamp for every record
+        saved = save_attendance_records(db["attendance"], attendance_records_db)
+        print(f"Saved {len(attendance_records_db)} records to AttendanceDB.attendance "
+              f"({saved['upserted']} new, {saved['modified']} updated, {saved['failed']} failed)")
 
         # Verify the file was saved
         saved_file = fs.find_one({"filename": filename})
@@ -276,11 +243,18 @@ def live_attendance():
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
         return jsonify({"error": f"Failed to save report: {str(e)}"}), 500
+    timer.add("db", elapsed_ms(step_start))
+
+    stage_timings = timer.finish()
+    if timings_requested():
+        timings = {**(timings or {}), "stages": stage_timings}
 
     return jsonify({
         "message": "Live attendance completed",
         "filename": filename,
         "present": len(attendance),
         "absent": len(absent_rolls),
-        "present_students": [{"roll": r, "name": attendance[r]["name"], "time": attendance[r]["time"]} for r in sorted(attendance)]
+        "records": saved,
+        "present_students": [{"roll": r, "name": attendance[r]["name"], "time": attendance[r]["time"]} for r in sorted(attendance)],
+        "timings": timings
     }), 200
@@ -5,6 +5,7 @@ import jwt
 import datetime
 import os
 from dotenv import load_dotenv
+from utils.roster import ROSTER_FIELDS
 
 load_dotenv()
 
@@ -246,7 +247,7 @@ def get_branch_attendance(branch_id):
         today = datetime.datetime.now().strftime("%Y-%m-%d")
         
         # Get students in this branch
-        branch_students = list(students_collection.find({"department": branch["name"]}))
+        branch_students = list(students_collection.find({"department": branch["name"]}, ROSTER_FIELDS))
         
         section_stats = []
         for section in branch["sections"]:
@@ -305,7 +306,7 @@ def get_section_students(branch_id, section):
         section_students = list(students_collection.find({
             "department": branch["name"],
             "section": section
-        }))
+        }, ROSTER_FIELDS))
         
         # Get attendance records for these students today
         section_rolls = [str(s.get("rollNo")) for s in section_students]
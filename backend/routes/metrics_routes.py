@@ -0,0 +1,13 @@
+from flask import Blueprint, Response
+
+from utils.metrics import render
+
+# ---------------- Blueprint ----------------
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+
+# ---------------- METRICS ----------------
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Per-route stage latency histograms in the Prometheus text format."""
+    return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -1,8 +1,8 @@
 import cv2
+import json
 import numpy as np
 import os
 from flask import Blueprint, request, jsonify
-from numpy.linalg import norm
 from dotenv import load_dotenv
 from pymongo import MongoClient
 import os
@@ -16,6 +16,7 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 ARC_THRESHOLD = 0.38
 CTX_ID = -1
+MAX_TOP_K = 10   # candidates per face; the endpoint is public, keep the search bounded
 
 # ---------------- DB ----------------
 client = MongoClient(MONGO_URI)
@@ -23,7 +24,13 @@ db = client["AttendanceDB"]
 students_col = db["students"]
 
 from utils.model_loader import get_model
-from utils.student_data import get_student_data
+from utils.student_data import get_student_data, get_partition_rows
+from utils.face_matcher import FaceMatcher
+from utils.face_pipeline import get_faces, detect_faces, embed_faces, get_faces_from_crops, ROI_FULL_FRAME_EVERY
+from utils.live_sessions import sessions, SESSION_TTL
+from routes.jwt_middleware import token_required
+from utils.inference_pool import inference_pool, InferenceOverloaded
+from utils.metrics import RequestTimer, stage, timings_requested
 
 model = get_model()
 
@@ -32,65 +39,106 @@ def get_current_data():
 
 
 
+# ---------------- LIVE SESSIONS ----------------
+@recognition_bp.route("/session", methods=["POST"])
+@token_required
+def open_session():
+    class_section = request.form.get("class") or (request.get_json(silent=True) or {}).get("class")
+    session = sessions.open(class_section, request.teacher)
+    return jsonify({"session_id": session.id, "ttl": SESSION_TTL}), 201
+
+
+@recognition_bp.route("/session/<session_id>", methods=["DELETE"])
+@token_required
+def close_session(session_id):
+    if sessions.close(session_id) is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    return jsonify({"message": "Session closed"}), 200
+
+
+def _match_info(result, top_k):
+    match_info = {"name": "Unknown", "roll": "Unknown", "confidence": 0}
+    if result["index"] is not None:
+        match_info = {
+            "name": result["name"],
+            "roll": result["roll"],
+            "confidence": result["confidence"]
+        }
+    if top_k > 1:
+        match_info["candidates"] = result["candidates"]
+    return match_info
+
+
+def _parse_boxes(raw):
+    """
+    Client face boxes, as JSON text or already parsed: [[x, y, w, h], ...] or face-api.js style
+    [{"x", "y", "width", "height"}, ...]. Malformed input means no boxes.
+    """
+    if not raw:
+        return []
+    try:
+        boxes = []
+        for box in (json.loads(raw) if isinstance(raw, str) else raw):
+            if isinstance(box, dict):
+                box = [box["x"], box["y"], box["width"], box["height"]]
+            boxes.append([float(v) for v in box[:4]])
+        return boxes
+    except (ValueError, TypeError, KeyError, IndexError):
+        return []
+
+
+def _track_info(track):
+    if track.roll is None:
+        return {"name": "Unknown", "roll": "Unknown", "confidence": 0}
+    return {"name": track.name, "roll": track.roll, "confidence": track.confidence}
+
+
 @recognition_bp.route("/frame", methods=["POST"])
 def recognize_frame():
     try:
-        if 'image' not in request.files:
+        crops = request.files.getlist('crops')
+        if 'image' not in request.files and not crops:
             return jsonify({"error": "No image provided"}), 400
 
+        session = None
+        session_id = request.form.get("session_id")
+        if session_id:
+            session = sessions.get(session_id)
+            if session is None:
+                return jsonify({"error": "Unknown or expired session"}), 404
+
+        # Optional roster hint: match the expected section first
+        class_hint = request.form.get("class") or request.form.get("section")
+        try:
+            top_k = int(request.form.get("top_k", 1))
+        except ValueError:
+            return jsonify({"error": "top_k must be an integer"}), 400
+        top_k = min(max(1, top_k), MAX_TOP_K)
+        # Boxes from the client's own face detector, used as ROIs (or crop positions)
+        boxes = _parse_boxes(request.form.get("boxes"))
+
+        if 'image' not in request.files:
+            timer = RequestTimer("frame_crops")
+            (matches, debug_info), timings = inference_pool.run(recognize_crops, [crop.read() for crop in crops], session, class_hint, top_k, boxes, timer=timer)
+            return jsonify({"matches": matches, "debug": _with_timings(debug_info, timings, timer)}), 200
+
+        timer = RequestTimer("frame")
         file = request.files['image']
         img_bytes = file.read()
-        np_img = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+        with timer.stage("decode"):
+            np_img = np.frombuffer(img_bytes, np.uint8)
+            frame = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
 
         if frame is None:
             return jsonify({"error": "Invalid image format or corrupted file"}), 400
 
-        data = get_current_data()
-        names = data["names"]
-        rolls = data["rolls"]
-        encodings = data["encodings"]
-
-        faces = model.get(frame)
-        
-        debug_info = {
-            "faces_detected": len(faces),
-            "known_encodings": encodings.shape[0]
-        }
-
-        if not faces:
-            return jsonify({"matches": [], "debug": debug_info}), 200
-
-        all_face_results = []
-        
-        for face in faces:
-            # Match identification
-            emb = face.embedding
-            emb = emb / norm(emb)
-            
-            match_info = {"name": "Unknown", "roll": "Unknown", "confidence": 0}
-            
-            if encodings.shape[0] > 0:
-                # Use dot product for normalized vectors (equivalent to cosine similarity)
-                sims = np.dot(emb, encodings)
-                best_idx = np.argmax(sims)
-                max_sim = sims[best_idx]
-                
-                if max_sim >= ARC_THRESHOLD:
-                    match_info = {
-                        "name": names[best_idx],
-                        "roll": rolls[best_idx],
-                        "confidence": float(max_sim)
-                    }
-
-            bbox = face.bbox.astype(int).tolist()
-            all_face_results.append({
-                **match_info,
-                "bbox": bbox
-            })
-
-        return jsonify({"matches": all_face_results, "debug": debug_info}), 200
+        # track=0: still photos scanned into a session, recorded but not tracked
+        track = request.form.get("track", "1") != "0"
+        (matches, debug_info), timings = inference_pool.run(recognize_image, frame, session, class_hint, top_k, boxes, track=track, timer=timer)
+        return jsonify({"matches": matches, "debug": _with_timings(debug_info, timings, timer)}), 200
     
+    except InferenceOverloaded:
+        raise  # 503 + Retry-After, see app.py
     except Exception as e:
         print(f"!!! CRASH IN RECOGNIZE_FRAME: {str(e)}")
         import traceback
@@ -100,3 +148,137 @@ def recognize_frame():
             "details": str(e)
         }), 500
 
+
+def _with_timings(debug_info, pool_timings, timer):
+    """Adds the inference pool's queue/compute split, and the stage breakdown when asked for."""
+    debug_info.update(pool_timings)
+    timer.add("queue", pool_timings["queue_ms"])
+    stage_timings = timer.finish()
+    if timings_requested():
+        debug_info["timings"] = stage_timings
+    return debug_info
+
+
+def _matching_context(session, class_hint):
+    data = get_current_data()
+    matcher = FaceMatcher(data)
+    partition_rows = get_partition_rows(data, class_hint or (session.class_section if session else None))
+    debug_info = {
+        "known_encodings": matcher.size,
+        "section_encodings": len(partition_rows) if partition_rows is not None else None
+    }
+    return matcher, partition_rows, debug_info
+
+
+def recognize_image(frame, session=None, class_hint=None, top_k=1, boxes=None, track=True, timer=None):
+    """
+    Recognises every face of a decoded frame. Returns (matches, debug).
+    Shared by the /frame endpoint and the streaming socket.
+    """
+    if session is not None and track:
+        return _recognize_tracked(frame, session, class_hint, top_k, boxes, timer)
+
+    with stage(timer, "gallery"):
+        matcher, partition_rows, debug_info = _matching_context(session, class_hint)
+    faces = get_faces(frame, model, rois=boxes, timer=timer)
+    debug_info.update({"faces_detected": len(faces), "client_boxes": len(boxes or [])})
+    if not faces:
+        return [], debug_info
+
+    # Match every face of the frame in one pass
+    with stage(timer, "match"):
+        results = matcher.identify([face.embedding for face in faces], threshold=ARC_THRESHOLD, k=top_k, rows=partition_rows)
+    if session is not None:
+        with session.lock:
+            for result in results:
+                session.record(result)
+
+    all_face_results = []
+    for face, result in zip(faces, results):
+        bbox = face.bbox.astype(int).tolist()
+        all_face_results.append({
+            **_match_info(result, top_k),
+            "bbox": bbox
+        })
+    return all_face_results, debug_info
+
+
+def recognize_crops(blobs, session=None, class_hint=None, top_k=1, boxes=None, timer=None):
+    """
+    Pre-cropped faces from the client: no full-frame detection at all. Boxes,
+    when sent one per crop, are echoed back as the crops' frame positions.
+    """
+    boxes = boxes or []
+    with stage(timer, "gallery"):
+        matcher, partition_rows, debug_info = _matching_context(session, class_hint)
+    faces = get_faces_from_crops(blobs, model, timer=timer)
+    found = [i for i, face in enumerate(faces) if face is not None]
+    with stage(timer, "match"):
+        results = matcher.identify([faces[i].embedding for i in found], threshold=ARC_THRESHOLD, k=top_k, rows=partition_rows)
+
+    if session is not None:
+        with session.lock:
+            for result in results:
+                session.record(result)
+
+    with_boxes = len(boxes) == len(blobs)
+    all_face_results = [
+        {
+            **_match_info(result, top_k),
+            "crop": i,
+            "bbox": [int(boxes[i][0]), int(boxes[i][1]), int(boxes[i][0] + boxes[i][2]), int(boxes[i][1] + boxes[i][3])] if with_boxes else None
+        }
+        for i, result in zip(found, results)
+    ]
+    debug_info.update({"crops": len(blobs), "faces_detected": len(found)})
+    return all_face_results, debug_info
+
+
+def _recognize_tracked(frame, session, class_hint, top_k, boxes=None, timer=None):
+    """
+    Frame of a live session: detect every face, but embed + match only the
+    faces whose track is new or not yet confirmed.
+    """
+    with stage(timer, "gallery"):
+        matcher, partition_rows, debug_info = _matching_context(session, class_hint)
+    # Every N frames the whole frame is searched too, for faces the client never boxed
+    full_frame = bool(ROI_FULL_FRAME_EVERY) and session.frames % ROI_FULL_FRAME_EVERY == 0
+    with stage(timer, "detect"):
+        faces = detect_faces(frame, model, rois=boxes, full_frame=full_frame)
+
+    # Frames of one session are handled one at a time so tracks stay consistent
+    with session.lock:
+        tracks = session.associate([face.bbox[:4].copy() for face in faces])
+        pending = [i for i, track in enumerate(tracks) if not track.confirmed]
+
+        results = {}
+        if pending:
+            with stage(timer, "embed"):
+                embed_faces([(frame, faces[i]) for i in pending], model)
+            with stage(timer, "match"):
+                identified = matcher.identify([faces[i].embedding for i in pending], threshold=ARC_THRESHOLD, k=top_k, rows=partition_rows)
+            for i, result in zip(pending, identified):
+                tracks[i].observe(result)
+                session.record(result)
+                results[i] = result
+
+        all_face_results = []
+        for i, (face, track) in enumerate(zip(faces, tracks)):
+            info = _match_info(results[i], top_k) if i in results else _track_info(track)
+            all_face_results.append({
+                **info,
+                "bbox": face.bbox.astype(int).tolist(),
+                "track_id": track.id,
+                "tracked": i not in results
+            })
+
+        debug_info.update({
+            "faces_detected": len(faces),
+            "faces_embedded": len(pending),
+            "client_boxes": len(boxes or []),
+            "session_id": session.id,
+            "tracks": len(session.tracks),
+            "present": len(session.present)
+        })
+
+    return all_face_results, debug_info
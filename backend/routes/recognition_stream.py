@@ -0,0 +1,207 @@
+"""
+WebSocket streaming for live recognition: /ws/recognition
+
+The client keeps one socket open, pushes binary JPEG frames and receives
+match results as JSON, instead of one multipart POST per tick. Frames are not
+queued: a reader thread keeps only the newest frame, and every frame that
+arrives while the previous one is still being recognised replaces it (and is
+counted as dropped), so latency stays bounded by one inference.
+
+    ws://host/ws/recognition?class=<class>[&session_id=<id>]
+
+The first message must be {"type": "auth", "token": "<jwt>"} (kept out of the
+URL so the token does not end up in access logs); without a valid token the
+socket gets an error and is closed. After that, text messages are JSON
+control messages: {"boxes": [...]} attaches client face boxes to the next
+frame, {"type": "close"} ends the stream. The socket runs inside a live
+session of the authenticated teacher: an existing one given by session_id
+(which must belong to that teacher), or one it opens itself and closes again
+when the stream ends. /api/attendance/live/finalize works the same as with
+/frame.
+
+Needs the optional flask-sock package and a threaded server (gunicorn
+--worker-class gthread); without flask-sock the endpoint is simply not
+registered.
+"""
+import json
+import threading
+
+import jwt
+from flask import request
+
+from routes.jwt_middleware import JWT_SECRET_KEY
+from routes.recognition_routes import recognize_image, _parse_boxes, _with_timings
+from utils.face_pipeline import decode_image
+from utils.inference_pool import inference_pool, InferenceOverloaded
+from utils.live_sessions import sessions
+from utils.metrics import RequestTimer
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+STREAM_IDLE_TIMEOUT = 60  # seconds without a frame before the server closes the socket
+STREAM_AUTH_TIMEOUT = 10  # seconds to wait for the auth message
+
+sock = Sock() if Sock is not None else None
+
+
+class LatestFrame:
+    """One-slot mailbox: put() overwrites a frame nobody has taken yet."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._seq = 0
+        self.dropped = 0
+        self.closed = False
+        self.error = None   # why the reader stopped, reported by the sending side
+
+    def put(self, data, boxes=None):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._seq += 1
+            self._item = (self._seq, data, boxes)
+            self._cond.notify()
+
+    def close(self, error=None):
+        with self._cond:
+            self.closed = True
+            self.error = self.error or error
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """Returns (seq, data, boxes), or None on timeout / once closed and empty."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self.closed, timeout)
+            item, self._item = self._item, None
+            return item
+
+
+def _teacher_from_token(token):
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        return None
+
+
+def _authenticate(ws):
+    # Browsers cannot set headers on a WebSocket, so the JWT comes as the first message
+    try:
+        message = ws.receive(timeout=STREAM_AUTH_TIMEOUT)
+        auth = json.loads(message) if isinstance(message, str) else {}
+    except Exception:
+        return None
+    if not isinstance(auth, dict) or auth.get("type") != "auth":
+        return None
+    return _teacher_from_token(auth.get("token"))
+
+
+def _close_with_error(ws, error):
+    ws.send(json.dumps({"type": "error", "error": error}))
+    ws.close()
+
+
+def _read_frames(ws, mailbox):
+    boxes = None
+    try:
+        while True:
+            message = ws.receive()
+            if message is None:
+                continue
+            if isinstance(message, (bytes, bytearray)):
+                mailbox.put(bytes(message), boxes)
+                boxes = None
+                continue
+            try:
+                control = json.loads(message)
+            except ValueError:
+                continue
+            if not isinstance(control, dict):
+                # Sends stay on the streaming thread, which reports this and closes
+                mailbox.close("Control messages must be JSON objects")
+                break
+            if control.get("type") == "close":
+                break
+            if "boxes" in control:
+                boxes = _parse_boxes(control["boxes"])
+    except Exception:
+        # ConnectionClosed and friends: the client went away
+        pass
+    finally:
+        mailbox.close()
+
+
+def recognition_stream(ws):
+    teacher = _authenticate(ws)
+    if teacher is None:
+        _close_with_error(ws, "Token is missing or invalid")
+        return
+
+    session_id = request.args.get("session_id")
+    owns_session = not session_id
+    if session_id:
+        session = sessions.get(session_id)
+        if session is None:
+            _close_with_error(ws, "Unknown or expired session")
+            return
+        if not session.teacher or session.teacher.get("email") != teacher.get("email"):
+            _close_with_error(ws, "Session belongs to another teacher")
+            return
+    else:
+        session = sessions.open(request.args.get("class"), teacher)
+
+    try:
+        ws.send(json.dumps({"type": "session", "session_id": session.id}))
+        _stream(ws, session)
+    finally:
+        if owns_session:
+            sessions.close(session.id)
+
+
+def _stream(ws, session):
+    mailbox = LatestFrame()
+    threading.Thread(target=_read_frames, args=(ws, mailbox), daemon=True, name="ws-recognition-reader").start()
+
+    while True:
+        item = mailbox.take(timeout=STREAM_IDLE_TIMEOUT)
+        if item is None:
+            break
+        seq, data, boxes = item
+
+        timer = RequestTimer("stream")
+        with timer.stage("decode"):
+            frame = decode_image(data)
+        if frame is None:
+            ws.send(json.dumps({"type": "error", "seq": seq, "error": "Invalid image format or corrupted file"}))
+            continue
+
+        try:
+            (matches, debug_info), timings = inference_pool.run(recognize_image, frame, session, boxes=boxes, timer=timer)
+        except InferenceOverloaded as e:
+            # The frame is dropped; the client just keeps streaming
+            ws.send(json.dumps({"type": "busy", "seq": seq, "retry_after": e.retry_after}))
+            continue
+        except Exception as e:
+            print(f"!!! CRASH IN RECOGNITION STREAM: {str(e)}")
+            ws.send(json.dumps({"type": "error", "seq": seq, "error": str(e)}))
+            continue
+        _with_timings(debug_info, timings, timer)
+        debug_info["dropped_frames"] = mailbox.dropped
+        ws.send(json.dumps({"type": "matches", "seq": seq, "matches": matches, "debug": debug_info}))
+
+    if mailbox.error:
+        _close_with_error(ws, mailbox.error)
+
+
+def init_stream(app):
+    """Registers /ws/recognition when flask-sock is installed."""
+    if sock is None:
+        print("flask-sock not installed: /ws/recognition disabled")
+        return
+    sock.route("/ws/recognition")(recognition_stream)
+    sock.init_app(app)
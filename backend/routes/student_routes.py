@@ -40,6 +40,9 @@ CTX_ID = -1  # CPU mode
 # LOAD ARCFACE MODEL (SINGLETON)
 # --------------------------------------------------
 from utils.model_loader import get_model
+from utils.student_data import record_student_change
+from utils.embedding_codec import build_embedding_doc, EMBEDDINGS_COLLECTION
+from utils.inference_pool import inference_pool, InferenceOverloaded
 model = get_model()
 
 # --------------------------------------------------
@@ -48,6 +51,7 @@ model = get_model()
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
 students_col = db[COLLECTION]
+embeddings_col = db[EMBEDDINGS_COLLECTION]
 
 # --------------------------------------------------
 # STUDENT REGISTRATION API
@@ -67,7 +71,7 @@ def register_student():
             return jsonify({"error": "Missing required fields"}), 400
 
         # -------- DUPLICATE CHECK --------
-        if students_col.find_one({"rollNo": roll_no}):
+        if students_col.find_one({"rollNo": roll_no}, {"_id": 1}):
             return jsonify({"error": "Roll number already registered"}), 409
 
         # -------- READ IMAGE --------
@@ -79,7 +83,7 @@ def register_student():
             return jsonify({"error": "Invalid image file"}), 400
 
         # -------- FACE DETECTION --------
-        faces = model.get(img)
+        faces, _ = inference_pool.run(model.get, img)
 
         if len(faces) == 0:
             return jsonify({"error": "No face detected"}), 400
@@ -92,26 +96,39 @@ def register_student():
         embedding = embedding / np.linalg.norm(embedding)
 
         # -------- INSERT INTO DB --------
+        # Mongo keeps milliseconds: truncate so the gallery's stamp matches the stored value
+        now = datetime.utcnow()
+        registered_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
         student_doc = {
             "rollNo": roll_no,
             "name": name,
             "email": email,
             "department": department,
             "section": section,
-            "face_encoding": embedding.tolist(),
-            "model": "arcface",
-            "registeredAt": datetime.utcnow()
+            "registeredAt": registered_at
         }
 
         result = students_col.insert_one(student_doc)
         print(f"Student registered with ID: {result.inserted_id}")
 
+        # Embedding goes to its own collection so roster reads stay small
+        embedding_doc = build_embedding_doc(roll_no, embedding, registered_at)
+        embeddings_col.replace_one({"rollNo": roll_no}, embedding_doc, upsert=True)
+
+        # -------- MAKE RECOGNISABLE WITHOUT A FULL RELOAD --------
+        try:
+            record_student_change(student_doc, embedding_doc)
+        except Exception as e:
+            print(f"Gallery update failed, student will appear after next reload: {e}")
+
         return jsonify({
             "message": "Student registered successfully",
             "rollNo": roll_no,
             "name": name
         }), 201
 
+    except InferenceOverloaded:
+        raise  # 503 + Retry-After, see app.py
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -128,21 +145,21 @@ def get_students_by_section(section_code):
         else:
             query = {"section": section_code}
             
-        students = list(students_col.find(query))
+        # Legacy documents may still carry face_encoding, never send it
+        fields = {"face_encoding": 0, "face_encoding_dtype": 0}
+        students = list(students_col.find(query, fields))
         
         # 2. Try direct match (e.g. Sec="AIML-B")
         if not students and "-" in section_code:
-             students = list(students_col.find({"section": section_code}))
+             students = list(students_col.find({"section": section_code}, fields))
         
         # 3. Final Fallback: Return ALL students so the UI is never empty
         if not students:
             print("DEBUG: All filters failed, returning all students as fallback")
-            students = list(students_col.find({}))
+            students = list(students_col.find({}, fields))
 
         for s in students:
             s["_id"] = str(s["_id"])
-            if "face_encoding" in s:
-                del s["face_encoding"]
         return jsonify(students), 200
     except Exception as e:
         print(f"ERROR: {e}")
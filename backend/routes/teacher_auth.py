@@ -5,6 +5,7 @@ import jwt
 import datetime
 import os
 from dotenv import load_dotenv
+from utils.roster import ROSTER_FIELDS
 
 load_dotenv()
 
@@ -412,7 +413,7 @@ def get_attendance_report():
                     query_or_list.append({"department": dept, "section": sec})
         
         students_collection = db_att["students"]
-        all_students = list(students_collection.find({"$or": query_or_list}))
+        all_students = list(students_collection.find({"$or": query_or_list}, ROSTER_FIELDS))
         
         if not all_students:
              return jsonify({
@@ -0,0 +1,136 @@
+import os
+import numpy as np
+
+# Galleries smaller than this are scanned exactly, the GEMM is already cheap
+ANN_EXACT_CUTOFF = int(os.getenv("ANN_EXACT_CUTOFF", "20000"))
+ANN_PROBES = int(os.getenv("ANN_PROBES", "8"))
+ANN_LISTS = int(os.getenv("ANN_LISTS", "0"))  # 0 = derive from gallery size
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit-length encodings.
+    Spherical k-means picks coarse centroids, every encoding is stored in the
+    list of its nearest centroid, and a query only scores the members of its
+    n_probe closest lists. Scores are exact dot products on the full vectors,
+    so the shortlist is re-ranked exactly and results are directly comparable
+    with the brute-force matcher.
+    """
+
+    def __init__(self, n_lists=None, n_probe=ANN_PROBES, iterations=10, train_size=None, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = None
+        self.vectors = None    # encodings reordered so each list is contiguous
+        self.row_ids = None    # original gallery row of every reordered vector
+        self.offsets = None    # list i spans vectors[offsets[i]:offsets[i + 1]]
+
+    @property
+    def size(self):
+        return 0 if self.vectors is None else self.vectors.shape[0]
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuilds an index from saved arrays (see utils.gallery_snapshot)."""
+        index = cls(n_lists=arrays["n_lists"], n_probe=arrays.get("n_probe", ANN_PROBES))
+        index.centroids = arrays["centroids"]
+        index.vectors = arrays["vectors"]
+        index.row_ids = arrays["row_ids"]
+        index.offsets = arrays["offsets"]
+        return index
+
+    def build(self, encodings):
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+        n = encodings.shape[0]
+        n_lists = self.n_lists or max(1, int(round(np.sqrt(n))))
+        n_lists = min(n_lists, n)
+        self.n_lists = n_lists
+
+        rng = np.random.default_rng(self.seed)
+        train_size = self.train_size or min(n, 64 * n_lists)
+        train = encodings[rng.choice(n, size=train_size, replace=False)] if train_size < n else encodings
+        self.centroids = _spherical_kmeans(train, n_lists, self.iterations, rng)
+
+        assign = self._nearest_lists(encodings, 1)[:, 0]
+        order = np.argsort(assign, kind="stable")
+        self.vectors = np.ascontiguousarray(encodings[order])
+        self.row_ids = order.astype(np.int64)
+        counts = np.bincount(assign, minlength=n_lists)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return self
+
+    def _nearest_lists(self, queries, n_probe):
+        sims = queries @ self.centroids.T
+        n_probe = min(n_probe, self.centroids.shape[0])
+        if n_probe == 1:
+            return np.argmax(sims, axis=1)[:, None]
+        return np.argpartition(-sims, n_probe - 1, axis=1)[:, :n_probe]
+
+    def search(self, queries, k=1, n_probe=None):
+        """
+        Returns (indices, scores) shaped (queries, k) in gallery row order,
+        best first. Queries must already be unit length. Missing candidates
+        (probed lists smaller than k) are reported as index -1.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        n_queries = queries.shape[0]
+        best_idx = np.full((n_queries, k), -1, dtype=np.int64)
+        best_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        if n_queries == 0 or self.size == 0:
+            return best_idx, best_scores
+
+        probes = self._nearest_lists(queries, n_probe or self.n_probe)
+
+        # Score each probed list once for all queries that probe it
+        for list_id in np.unique(probes):
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            q_rows = np.flatnonzero((probes == list_id).any(axis=1))
+            sims = queries[q_rows] @ self.vectors[start:end].T
+            members = np.broadcast_to(self.row_ids[start:end], sims.shape)
+
+            merged_scores = np.concatenate([best_scores[q_rows], sims], axis=1)
+            merged_idx = np.concatenate([best_idx[q_rows], members], axis=1)
+            top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            best_scores[q_rows] = np.take_along_axis(merged_scores, top, axis=1)
+            best_idx[q_rows] = np.take_along_axis(merged_idx, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def _spherical_kmeans(data, n_clusters, iterations, rng):
+    """k-means on the unit sphere (cosine assignment, normalised centroid means)."""
+    centroids = data[rng.choice(data.shape[0], size=n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        counts = np.bincount(assign, minlength=n_clusters)
+        order = np.argsort(assign, kind="stable")
+        used = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)])[used]
+        sums = np.zeros_like(centroids)
+        sums[used] = np.add.reduceat(data[order], starts, axis=0)
+
+        # Re-seed empty clusters from random points so no list stays unused
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = data[rng.choice(data.shape[0], size=empty.size, replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def build_ann_index(encodings, exact_cutoff=ANN_EXACT_CUTOFF, n_lists=ANN_LISTS, n_probe=ANN_PROBES):
+    """
+    Builds an IVF index for large galleries.
+    Returns None below exact_cutoff so callers keep the exact scan.
+    """
+    if encodings.shape[0] < max(exact_cutoff, 1):
+        return None
+    return IVFIndex(n_lists=n_lists or None, n_probe=n_probe).build(encodings)
@@ -0,0 +1,64 @@
+"""
+Attendance record persistence shared by the live, live/finalize and group
+routes.
+
+All records of a session go to the attendance collection as UpdateOne upserts
+keyed by (rollNo, date, className) in a single unordered bulk_write: one round
+trip per session instead of one per student, and every record carries the same
+timestamp. With ordered=False a failing record does not stop the others. An
+upsert that loses a race with a concurrent one (duplicate key) is retried
+once, because by then the document exists and the retry simply updates it.
+"""
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+RECORD_KEY = ("rollNo", "date", "className")
+DUPLICATE_KEY = 11000
+
+
+def _operations(records, timestamp):
+    return [
+        UpdateOne({k: record[k] for k in RECORD_KEY}, {"$set": {**record, "timestamp": timestamp}}, upsert=True)
+        for record in records
+    ]
+
+
+def _bulk_upsert(collection, records, timestamp):
+    """Returns (counts, [(record, write error)])."""
+    try:
+        result = collection.bulk_write(_operations(records, timestamp), ordered=False)
+        return {"upserted": result.upserted_count, "modified": result.modified_count, "matched": result.matched_count}, []
+    except BulkWriteError as e:
+        details = e.details
+        counts = {"upserted": details.get("nUpserted", 0), "modified": details.get("nModified", 0), "matched": details.get("nMatched", 0)}
+        return counts, [(records[err["index"]], err) for err in details.get("writeErrors", [])]
+
+
+def save_attendance_records(collection, records, timestamp=None):
+    """
+    Upserts the records in one bulk_write. Returns {"upserted", "modified",
+    "matched", "failed", "errors"}; errors lists the rolls that could not be
+    written, the rest of the batch is kept.
+    """
+    summary = {"upserted": 0, "modified": 0, "matched": 0, "failed": 0, "errors": []}
+    if not records:
+        return summary
+    timestamp = timestamp or datetime.utcnow()
+
+    counts, failures = _bulk_upsert(collection, records, timestamp)
+    retry = [record for record, err in failures if err.get("code") == DUPLICATE_KEY]
+    failures = [(record, err) for record, err in failures if err.get("code") != DUPLICATE_KEY]
+    if retry:
+        retry_counts, retry_failures = _bulk_upsert(collection, retry, timestamp)
+        for key in counts:
+            counts[key] += retry_counts[key]
+        failures += retry_failures
+
+    summary.update(counts)
+    summary["failed"] = len(failures)
+    summary["errors"] = [{"rollNo": record["rollNo"], "error": err.get("errmsg")} for record, err in failures]
+    if failures:
+        print(f"Attendance bulk write: {len(failures)} of {len(records)} records failed: {summary['errors'][:5]}")
+    return summary
@@ -0,0 +1,190 @@
+"""
+Declarative MongoDB index registry.
+
+    python -m utils.db_indexes              # create missing indexes
+    python -m utils.db_indexes --dry-run    # list what would be created
+    python -m utils.db_indexes --explain    # which index each hot query uses
+
+INDEXES lists, per (database, collection), the indexes the routes' hot
+queries need. ensure_indexes() creates them with create_index, which is a
+no-op for an index that already exists, so it runs on every app start
+(ENSURE_INDEXES=0 skips it) and from this CLI. An index that cannot be built
+(conflicting options, duplicate data under a unique key) is reported and
+skipped; it never stops the app from starting.
+
+--explain runs one representative query per route through explain() and
+reports the winning plan: IXSCAN with the index name, or COLLSCAN.
+"""
+import argparse
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import PyMongoError
+
+from utils.embedding_codec import EMBEDDINGS_COLLECTION, EMBEDDING_MODEL, model_version_filter
+
+load_dotenv()
+
+ENSURE_INDEXES = os.getenv("ENSURE_INDEXES", "1") == "1"
+
+# Connection string env variable per database
+DATABASE_URIS = {
+    "AttendanceDB": "MONGO_URI",
+    "AuthDB": "AUTH_MONGO_URI",
+    "TeacherAuthDB": "AUTH_MONGO_URI"
+}
+
+INDEXES = {
+    ("AttendanceDB", "attendance"): [
+        # Upsert key of the live / group / finalize bulk writes
+        {"keys": [("rollNo", ASCENDING), ("date", ASCENDING), ("className", ASCENDING)],
+         "name": "rollNo_date_className", "unique": True},
+        # HOD dashboard and history
+        {"keys": [("date", ASCENDING), ("status", ASCENDING)], "name": "date_status"},
+        # Teacher daily summary
+        {"keys": [("facultyId", ASCENDING), ("date", ASCENDING)], "name": "facultyId_date"},
+        # Subject / class analytics
+        {"keys": [("subject", ASCENDING), ("className", ASCENDING), ("date", ASCENDING)],
+         "name": "subject_className_date"}
+    ],
+    ("AttendanceDB", "students"): [
+        {"keys": [("department", ASCENDING), ("section", ASCENDING)], "name": "department_section"},
+        {"keys": [("rollNo", ASCENDING)], "name": "rollNo", "unique": True}
+    ],
+    ("AttendanceDB", EMBEDDINGS_COLLECTION): [
+        # One embedding per student: registration and migration upsert on rollNo
+        {"keys": [("rollNo", ASCENDING)], "name": "rollNo", "unique": True},
+        # Incremental gallery sync: model + pack + registeredAt watermark
+        {"keys": [("model", ASCENDING), ("modelVersion", ASCENDING), ("registeredAt", ASCENDING)],
+         "name": "model_modelVersion_registeredAt"}
+    ],
+    ("TeacherAuthDB", "teachers"): [
+        {"keys": [("email", ASCENDING)], "name": "email", "unique": True}
+    ],
+    ("AuthDB", "hods"): [
+        {"keys": [("email", ASCENDING)], "name": "email", "unique": True}
+    ]
+}
+
+# (route, database, collection, filter) - one representative query per hot path
+EXPLAIN_QUERIES = [
+    ("POST /api/attendance/live|group (upsert)", "AttendanceDB", "attendance",
+     {"rollNo": "0", "date": "2000-01-01", "className": "Course (DEPT-A)"}),
+    ("POST /api/attendance/live|group (roster)", "AttendanceDB", "students", {"department": "DEPT", "section": "A"}),
+    ("POST /api/student/register", "AttendanceDB", "students", {"rollNo": "0"}),
+    ("GET /api/hod/dashboard-data", "AttendanceDB", "attendance", {"date": "2000-01-01", "status": "present"}),
+    ("POST /api/teacher/daily-attendance-summary", "AttendanceDB", "attendance",
+     {"facultyId": "F0", "date": "2000-01-01"}),
+    ("GET /api/analytics/subject/<subject>/<class>", "AttendanceDB", "attendance",
+     {"subject": "SUBJ", "className": "Course (DEPT-A)", "date": "2000-01-01"}),
+    ("GET /api/attendance/with-manual-info", "AttendanceDB", "attendance",
+     {"date": "2000-01-01", "className": "Course (DEPT-A)"}),
+    # Same shape as student_data._iter_embeddings' incremental query
+    ("gallery sync", "AttendanceDB", EMBEDDINGS_COLLECTION,
+     {"model": EMBEDDING_MODEL, "modelVersion": model_version_filter(),
+      "registeredAt": {"$gte": datetime(2000, 1, 1)}}),
+    ("POST /api/teacher/login", "TeacherAuthDB", "teachers", {"email": "x@example.com"}),
+    ("POST /api/hod/login", "AuthDB", "hods", {"email": "x@example.com"})
+]
+
+_clients = {}
+
+
+def _database(name):
+    uri = os.getenv(DATABASE_URIS[name])
+    if uri not in _clients:
+        _clients[uri] = MongoClient(uri)
+    return _clients[uri][name]
+
+
+def _key_pattern(keys):
+    # Servers may report 1.0 for 1; non-numeric directions are kept as they are
+    return tuple((field, int(d) if isinstance(d, float) and d.is_integer() else d) for field, d in keys)
+
+
+def ensure_indexes(dry_run=False):
+    """Creates every registered index. Returns {"created", "existing", "failed"} counts."""
+    summary = {"created": 0, "existing": 0, "failed": 0}
+    for (db_name, coll_name), specs in INDEXES.items():
+        try:
+            collection = _database(db_name)[coll_name]
+            # Matched by key pattern too: an index created by hand under another name counts
+            # Directions are compared as stored: 1 / -1, but also "text", "2dsphere", "hashed"...
+            existing = {
+                key: info
+                for name, info in collection.index_information().items()
+                for key in (name, _key_pattern(info["key"]))
+            }
+        except Exception as e:
+            print(f"Indexes: cannot read {db_name}.{coll_name}: {e}")
+            summary["failed"] += len(specs)
+            continue
+
+        for spec in specs:
+            info = existing.get(spec["name"]) or existing.get(_key_pattern(spec["keys"]))
+            if info is not None:
+                if bool(info.get("unique")) != spec.get("unique", False):
+                    # create_index cannot change an existing index's options
+                    print(f"Index {db_name}.{coll_name} {spec['name']} exists with unique={bool(info.get('unique'))}, "
+                          f"expected {spec.get('unique', False)}: drop it and re-run")
+                    summary["failed"] += 1
+                else:
+                    summary["existing"] += 1
+                continue
+            if dry_run:
+                print(f"Would create {db_name}.{coll_name} {spec['name']}{' (unique)' if spec.get('unique') else ''}")
+                summary["created"] += 1
+                continue
+            try:
+                collection.create_index(spec["keys"], name=spec["name"], unique=spec.get("unique", False))
+                print(f"Created index {db_name}.{coll_name} {spec['name']}")
+                summary["created"] += 1
+            except Exception as e:
+                # e.g. conflicting options, or duplicates under a unique key
+                print(f"Index {db_name}.{coll_name} {spec['name']} not created: {e}")
+                summary["failed"] += 1
+    return summary
+
+
+def _plan_stages(plan):
+    """Flattens a winningPlan into [(stage, index name)] from the root down."""
+    stages = []
+    while plan:
+        stages.append((plan.get("stage"), plan.get("indexName")))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return stages
+
+
+def explain_queries():
+    """Returns [(route, namespace, "IXSCAN <index>" | "COLLSCAN" | ...)] for EXPLAIN_QUERIES."""
+    report = []
+    for route, db_name, coll_name, query in EXPLAIN_QUERIES:
+        try:
+            explained = _database(db_name)[coll_name].find(query).explain()
+        except PyMongoError as e:
+            report.append((route, f"{db_name}.{coll_name}", f"error: {e}"))
+            continue
+        planner = explained.get("queryPlanner", {})
+        # Newer servers nest the classic plan under queryPlan
+        plan = planner.get("winningPlan", {})
+        stages = _plan_stages(plan.get("queryPlan", plan))
+        scans = [(stage, index) for stage, index in stages if stage in ("IXSCAN", "COLLSCAN", "IDHACK", "EXPRESS_IXSCAN")]
+        stage, index = scans[-1] if scans else stages[-1] if stages else ("UNKNOWN", None)
+        report.append((route, f"{db_name}.{coll_name}", f"{stage} {index}" if index else stage))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only list missing indexes")
+    parser.add_argument("--explain", action="store_true", help="report the plan of each route's representative query")
+    args = parser.parse_args()
+
+    if args.explain:
+        for route, namespace, plan in explain_queries():
+            flag = "!!" if plan.startswith("COLLSCAN") else "  "
+            print(f"{flag} {route:<48} {namespace:<28} {plan}")
+    else:
+        print(ensure_indexes(dry_run=args.dry_run))
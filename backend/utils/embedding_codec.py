@@ -0,0 +1,63 @@
+import os
+import numpy as np
+from bson.binary import Binary
+
+from utils.model_packs import RECOGNITION_MODEL_VERSION
+
+# Little-endian so documents decode the same on every host
+EMBEDDING_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2")
+}
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")
+
+# Embeddings live in their own collection, one document per roll number:
+# {rollNo, model, modelVersion, encoding, dtype, registeredAt}
+EMBEDDINGS_COLLECTION = "face_embeddings"
+EMBEDDING_MODEL = "arcface"
+# The recognition model that computes the embeddings: vectors from different
+# recognition models (FP32 vs INT8) are not comparable, so the gallery only
+# loads the active one's. A detector-only INT8 pack keeps the FP32 version.
+EMBEDDING_MODEL_VERSION = RECOGNITION_MODEL_VERSION
+# Embeddings stored before modelVersion existed were all computed with buffalo_s
+LEGACY_MODEL_VERSION = "buffalo_s"
+
+
+def encode_embedding(vector, dtype=EMBEDDING_DTYPE):
+    """Packs an embedding into a BSON BinData field."""
+    packed = np.ascontiguousarray(vector, dtype=EMBEDDING_DTYPES[dtype])
+    return Binary(packed.tobytes())
+
+
+def decode_embedding(value, dtype=None, out=None):
+    """
+    Decodes a stored embedding. Accepts the packed BinData format and the
+    legacy list-of-doubles format, so both can coexist during migration.
+    When out is given the values are written into it (e.g. a gallery row).
+    """
+    if isinstance(value, (bytes, bytearray, Binary)):
+        vector = np.frombuffer(value, dtype=EMBEDDING_DTYPES[dtype or "float32"])
+    else:
+        vector = np.asarray(value, dtype=np.float32)
+    if out is None:
+        return vector.astype(np.float32)
+    out[...] = vector
+    return out
+
+
+def model_version_filter(version=EMBEDDING_MODEL_VERSION):
+    """modelVersion condition for version; documents without the field count as LEGACY_MODEL_VERSION."""
+    return {"$in": [version, None]} if version == LEGACY_MODEL_VERSION else version
+
+
+def build_embedding_doc(roll_no, vector, registered_at, dtype=EMBEDDING_DTYPE, model_version=EMBEDDING_MODEL_VERSION):
+    """Document for the embeddings collection."""
+    return {
+        "rollNo": str(roll_no),
+        "model": EMBEDDING_MODEL,
+        "modelVersion": model_version,
+        "encoding": encode_embedding(vector, dtype),
+        "dtype": dtype,
+        "registeredAt": registered_at
+    }
+
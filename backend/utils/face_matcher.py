@@ -0,0 +1,146 @@
+import numpy as np
+
+ARC_THRESHOLD = 0.38
+
+
+def normalize_rows(vectors):
+    """
+    Stacks a list of embeddings (or a 2D array) into a contiguous float32
+    matrix with every row scaled to unit length.
+    """
+    mat = np.asarray(vectors, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(mat / norms, dtype=np.float32)
+
+
+class FaceMatcher:
+    """
+    Vectorised cosine matcher over the student gallery.
+    All faces of a frame (or of a whole upload) are matched with a single
+    matrix product against the float32 gallery instead of one np.dot per face.
+    """
+
+    def __init__(self, gallery):
+        # Take the views once so concurrent registrations never change shapes mid-match
+        self.encodings = gallery.encodings
+        self.active = gallery.active
+        self.names = gallery.names
+        self.rolls = gallery.rolls
+        # IVF index over the gallery as loaded, None when the gallery is small
+        self.index = gallery.index
+
+    @property
+    def size(self):
+        return self.encodings.shape[0]
+
+    def search(self, embeddings, k=1, rows=None):
+        """
+        Returns (indices, scores), both shaped (faces, k), sorted by descending
+        similarity. Embeddings are normalised here, callers pass raw vectors.
+        rows restricts the search to those gallery rows; indices stay global.
+        """
+        queries = normalize_rows(embeddings)
+        if rows is not None:
+            rows = rows[rows < self.size]
+        elif self.index is not None and queries.shape[0] > 0:
+            return self._search_index(queries, k)
+        return self._search_exact(queries, k, rows)
+
+    def _search_exact(self, queries, k, rows=None):
+        gallery = self.encodings if rows is None else self.encodings[rows]
+        k = max(1, min(k, gallery.shape[0]))
+        if gallery.shape[0] == 0 or queries.shape[0] == 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        sims = queries @ gallery.T
+        if k == 1:
+            idx = np.argmax(sims, axis=1)[:, None]
+        else:
+            idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(sims, idx, axis=1), axis=1)
+            idx = np.take_along_axis(idx, order, axis=1)
+        scores = np.take_along_axis(sims, idx, axis=1)
+        if rows is not None:
+            idx = rows[idx]
+        return idx, scores
+
+    def _search_index(self, queries, k):
+        idx, scores = self.index.search(queries, k=k)
+        # Rows registered after the index was built are scanned exactly
+        if self.index.size < self.size:
+            tail_idx, tail_scores = self._search_exact(queries, k, np.arange(self.index.size, self.size))
+            idx = np.concatenate([idx, tail_idx], axis=1)
+            scores = np.concatenate([scores, tail_scores], axis=1)
+
+        # The index keeps its own copy of the vectors, so drop removed rows here
+        valid = idx >= 0
+        valid[valid] = self.active[idx[valid]]
+        scores = np.where(valid, scores, -np.inf).astype(np.float32)
+        idx = np.where(valid, idx, -1)
+        order = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    def identify(self, embeddings, threshold=ARC_THRESHOLD, k=1, rows=None):
+        """
+        Matches every embedding and returns one dict per face:
+        {"index", "roll", "name", "confidence", "candidates", "scope"}.
+        index/roll/name are None when the best score is below threshold.
+        With rows (a section partition), faces are matched against that
+        roster first and only the ones below threshold fall back to the
+        full gallery.
+        """
+        if len(embeddings) == 0:
+            return []
+        queries = normalize_rows(embeddings)
+        if rows is not None:
+            # Partitions are read after this matcher's snapshot: rows appended since are not in it
+            rows = rows[rows < self.size]
+
+        if rows is not None and len(rows) > 0:
+            idx, scores = self.search(queries, k=k, rows=rows)
+            scope = ["section"] * len(queries)
+            retry = np.flatnonzero(scores[:, 0] < threshold)
+            if retry.size:
+                full_idx, full_scores = self.search(queries[retry], k=k)
+                # The full gallery can return more candidates than a small partition
+                width = full_idx.shape[1]
+                idx = _widen(idx, width, fill=-1)
+                scores = _widen(scores, width, fill=-np.inf)
+                idx[retry] = full_idx
+                scores[retry] = full_scores
+                for i in retry:
+                    scope[i] = "gallery"
+        else:
+            idx, scores = self.search(queries, k=k)
+            scope = ["gallery"] * len(queries)
+
+        results = []
+        for face_idx in range(idx.shape[0]):
+            candidates = [
+                {
+                    "roll": self.rolls[j],
+                    "name": self.names[j],
+                    "confidence": float(s)
+                }
+                for j, s in zip(idx[face_idx], scores[face_idx]) if j >= 0 and self.active[j]
+            ]
+            best = {"index": None, "roll": None, "name": None, "confidence": 0.0}
+            if candidates and candidates[0]["confidence"] >= threshold:
+                best = {"index": int(idx[face_idx, 0]), **candidates[0]}
+            best["candidates"] = candidates
+            best["scope"] = scope[face_idx]
+            results.append(best)
+        return results
+
+
+def _widen(arr, width, fill):
+    """Pads a (faces, k) result array with fill columns up to width."""
+    if arr.shape[1] >= width:
+        return arr
+    out = np.full((arr.shape[0], width), fill, dtype=arr.dtype)
+    out[:, :arr.shape[1]] = arr
+    return out
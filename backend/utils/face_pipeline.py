@@ -0,0 +1,353 @@
+"""
+Face detection + embedding on top of the shared FaceAnalysis model.
+
+Small frames go through a single model.get() pass. Large photos (longer side
+at or above TILE_MIN_SIDE) are split into overlapping tiles at detector
+resolution, so back-row faces are not shrunk away by the 640 px detector
+input. Tiles (plus one coarse pass over the whole image for faces larger
+than a tile) are detected in parallel, the boxes are merged with NMS in
+full-image coordinates, and only the merged faces are embedded, aligned on
+the full-resolution image.
+
+Recognition is batched: every detected face (across all images of a
+request) is aligned to a 112x112 crop and the crops go through the ArcFace
+ONNX model RECOGNITION_BATCH_SIZE at a time instead of one call per face.
+RECOGNITION_BATCH_SIZE=0 restores the plain FaceAnalysis.get() path.
+With MICRO_BATCH_WAIT_MS > 0 the crops of concurrent requests are also
+merged into shared batches (see utils.micro_batcher).
+
+Clients that already detect faces (face-api.js in LiveAttendance) can send
+their boxes: detection then only runs inside slightly padded ROIs at a small
+input size, or on pre-cropped faces. The whole frame is searched as well
+whenever a box yields no face, and every ROI_FULL_FRAME_EVERY frames of a live
+session for faces the client never boxed.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from insightface.app.common import Face
+from insightface.utils import face_align
+
+from utils.metrics import stage
+from utils.micro_batcher import MicroBatcher
+from utils.model_loader import get_model, INFERENCE_SLOTS, INFERENCE_FANOUT
+
+TILE_MIN_SIDE = int(os.getenv("TILE_MIN_SIDE", "1600"))
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.25"))
+# Detection fan-out, sized from the model-call budget (see utils.model_loader)
+TILE_WORKERS = int(os.getenv("TILE_WORKERS", "0")) or INFERENCE_SLOTS * INFERENCE_FANOUT
+# Upload images decoded + analysed concurrently per process
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "0")) or INFERENCE_SLOTS * INFERENCE_FANOUT
+# Aligned crops per ArcFace call, 0 = per-face FaceAnalysis path
+RECOGNITION_BATCH_SIZE = int(os.getenv("RECOGNITION_BATCH_SIZE", "32"))
+# Opt-in cross-request batching: max extra wait per request, 0 = off
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "0"))
+# Client boxes are grown by this fraction per side before detecting inside them
+ROI_PADDING = float(os.getenv("ROI_PADDING", "0.25"))
+ROI_DET_SIZE = int(os.getenv("ROI_DET_SIZE", "160"))   # detector input for ROIs / crops, multiple of 32
+# Live sessions search the whole frame every N frames for faces the client never boxed, 0 = never
+ROI_FULL_FRAME_EVERY = int(os.getenv("ROI_FULL_FRAME_EVERY", "10"))
+NMS_IOU = 0.4
+# A box mostly inside a higher-scoring one is the same face cut at a tile edge
+NMS_CONTAINMENT = 0.7
+
+_tile_pool = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tile-detect")
+_image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-analyze")
+# Flipped off if the recognition model turns out to have a fixed batch of 1
+_batching_supported = True
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def _tile_origins(length, tile, stride):
+    if length <= tile:
+        return [0]
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def tile_grid(height, width, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Returns (x, y, w, h) windows covering the image with the given overlap."""
+    stride = max(1, int(tile * (1 - overlap)))
+    return [
+        (x, y, min(tile, width - x), min(tile, height - y))
+        for y in _tile_origins(height, tile, stride)
+        for x in _tile_origins(width, tile, stride)
+    ]
+
+
+def nms(boxes, scores, iou_threshold=NMS_IOU, containment=NMS_CONTAINMENT):
+    """Greedy NMS; returns kept indices, best score first."""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        contained = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[(iou <= iou_threshold) & (contained <= containment)]
+    return np.array(keep, dtype=np.int64)
+
+
+def _detect_window(det_model, img, window, input_size):
+    x, y, w, h = window
+    bboxes, kpss = det_model.detect(np.ascontiguousarray(img[y:y + h, x:x + w]), input_size=input_size)
+    if bboxes.shape[0] == 0:
+        return bboxes, kpss
+    bboxes = bboxes.copy()
+    bboxes[:, [0, 2]] += x
+    bboxes[:, [1, 3]] += y
+    if kpss is not None:
+        kpss = kpss.copy()
+        kpss[:, :, 0] += x
+        kpss[:, :, 1] += y
+    return bboxes, kpss
+
+
+def detect_tiled(img, model=None):
+    """
+    Detects faces tile by tile. Returns (bboxes, kpss) in full-image
+    coordinates, bboxes shaped (N, 5) with the detection score last.
+    """
+    model = model or get_model()
+    height, width = img.shape[:2]
+    det_size = tuple(model.det_size)
+    windows = tile_grid(height, width, tile=TILE_SIZE)
+    # One coarse pass over the whole image catches faces larger than a tile
+    windows.append((0, 0, width, height))
+
+    results = list(_tile_pool.map(lambda win: _detect_window(model.det_model, img, win, det_size), windows))
+    found = [(b, k) for b, k in results if b.shape[0]]
+    if not found:
+        return np.empty((0, 5), dtype=np.float32), None
+    bboxes = np.concatenate([b for b, _ in found])
+    kpss = np.concatenate([k for _, k in found]) if all(k is not None for _, k in found) else None
+
+    keep = nms(bboxes[:, :4], bboxes[:, 4])
+    return bboxes[keep], kpss[keep] if kpss is not None else None
+
+
+def needs_tiling(img):
+    return max(img.shape[:2]) >= TILE_MIN_SIDE
+
+
+def _batching_enabled():
+    return RECOGNITION_BATCH_SIZE > 1 and _batching_supported
+
+
+def pad_roi(box, shape, padding=ROI_PADDING):
+    """Client (x, y, w, h) box -> padded (x, y, w, h) window clipped to the image."""
+    height, width = shape[:2]
+    x, y, w, h = (float(v) for v in box[:4])
+    pad_w, pad_h = w * padding, h * padding
+    x1, y1 = max(0, int(x - pad_w)), max(0, int(y - pad_h))
+    x2, y2 = min(width, int(x + w + pad_w)), min(height, int(y + h + pad_h))
+    return x1, y1, max(0, x2 - x1), max(0, y2 - y1)
+
+
+def detect_in_rois(img, boxes, model=None, input_size=None):
+    """
+    Detects only inside padded client boxes. Returns (bboxes, kpss, missed)
+    with bboxes / kpss like detect_tiled and missed the number of boxes in
+    which no face was found.
+    """
+    model = model or get_model()
+    input_size = input_size or (ROI_DET_SIZE, ROI_DET_SIZE)
+    windows = [win for win in (pad_roi(box, img.shape) for box in boxes) if win[2] > 1 and win[3] > 1]
+    results = list(_tile_pool.map(lambda win: _detect_window(model.det_model, img, win, input_size), windows))
+    found = [(b, k) for b, k in results if b.shape[0]]
+    missed = len(boxes) - len(found)
+    if not found:
+        return np.empty((0, 5), dtype=np.float32), None, missed
+    bboxes = np.concatenate([b for b, _ in found])
+    kpss = np.concatenate([k for _, k in found]) if all(k is not None for _, k in found) else None
+
+    keep = nms(bboxes[:, :4], bboxes[:, 4])
+    return bboxes[keep], kpss[keep] if kpss is not None else None, missed
+
+
+def _merge_detections(first, second):
+    """NMS over two (bboxes, kpss) sets, e.g. ROI hits plus a full-frame pass."""
+    sets = [(b, k) for b, k in (first, second) if b.shape[0]]
+    if len(sets) < 2:
+        return sets[0] if sets else second
+    bboxes = np.concatenate([b for b, _ in sets])
+    kpss = np.concatenate([k for _, k in sets]) if all(k is not None for _, k in sets) else None
+    keep = nms(bboxes[:, :4], bboxes[:, 4])
+    return bboxes[keep], kpss[keep] if kpss is not None else None
+
+
+def _build_faces(img, bboxes, kpss, model):
+    faces = []
+    for i in range(bboxes.shape[0]):
+        face = Face(bbox=bboxes[i, :4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        for taskname, task_model in model.models.items():
+            if taskname in ("detection", "recognition"):
+                continue
+            task_model.get(img, face)
+        faces.append(face)
+    return faces
+
+
+def _detect_full(img, model):
+    if needs_tiling(img):
+        return detect_tiled(img, model)
+    return model.det_model.detect(img, max_num=0, metric="default")
+
+
+def detect_faces(img, model=None, rois=None, full_frame=False):
+    """
+    Faces with bbox, kps, det_score and the outputs of every non-recognition
+    module, but no embedding yet (see embed_faces). With rois (client
+    (x, y, w, h) boxes) only those regions are searched, unless a box yields
+    no face or full_frame is set: then the whole frame is searched as well
+    and merged with the ROI hits, so one missed box cannot hide a student.
+    """
+    model = model or get_model()
+    if not rois:
+        bboxes, kpss = _detect_full(img, model)
+        return _build_faces(img, bboxes, kpss, model)
+
+    bboxes, kpss, missed = detect_in_rois(img, rois, model)
+    if missed or full_frame:
+        bboxes, kpss = _merge_detections((bboxes, kpss), _detect_full(img, model))
+    return _build_faces(img, bboxes, kpss, model)
+
+
+def _micro_batcher(rec_model):
+    with _batchers_lock:
+        batcher = _batchers.get(id(rec_model))
+        if batcher is None:
+            batcher = MicroBatcher(rec_model.get_feat, max_batch=RECOGNITION_BATCH_SIZE, max_wait_ms=MICRO_BATCH_WAIT_MS)
+            _batchers[id(rec_model)] = batcher
+        return batcher
+
+
+def _run_recognition(rec_model, crops):
+    if MICRO_BATCH_WAIT_MS > 0:
+        return _micro_batcher(rec_model).submit(crops)
+    return rec_model.get_feat(crops)
+
+
+def embed_faces(items, model=None, batch_size=None):
+    """
+    Sets face.embedding for (img, face) pairs, which may come from different
+    images. Crops are aligned on their own image and embedded in batches.
+    """
+    global _batching_supported
+    model = model or get_model()
+    rec_model = model.models.get("recognition")
+    if rec_model is None or not items:
+        return
+    batch_size = batch_size or RECOGNITION_BATCH_SIZE
+
+    if not _batching_enabled():
+        for img, face in items:
+            rec_model.get(img, face)
+        return
+
+    crop_size = rec_model.input_size[0]
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        crops = [face_align.norm_crop(img, landmark=face.kps, image_size=crop_size) for img, face in chunk]
+        try:
+            feats = _run_recognition(rec_model, crops)
+        except Exception as e:
+            # e.g. a model exported with a fixed batch dimension
+            print(f"Batched recognition failed, using per-face calls: {e}")
+            _batching_supported = False
+            for img, face in items[start:]:
+                rec_model.get(img, face)
+            return
+        for (_, face), feat in zip(chunk, feats):
+            face.embedding = feat.flatten()
+
+
+def get_faces(img, model=None, rois=None, timer=None):
+    """
+    Drop-in replacement for model.get(img): faces with bbox, kps, det_score
+    and embedding, using tiled detection for large images and the client's
+    boxes as ROIs when given. timer (utils.metrics.RequestTimer) gets the
+    detect / embed durations.
+    """
+    model = model or get_model()
+    if not rois and not _batching_enabled() and not needs_tiling(img):
+        # One FaceAnalysis pass, detection and embedding are not separable here
+        with stage(timer, "detect_embed"):
+            return model.get(img)
+
+    with stage(timer, "detect"):
+        faces = detect_faces(img, model, rois)
+    with stage(timer, "embed"):
+        embed_faces([(img, face) for face in faces], model)
+    return faces
+
+
+def decode_image(data):
+    """Decodes encoded image bytes (JPEG/PNG...) to BGR, None if unreadable."""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def _analyze_bytes(data, model, timer=None):
+    with stage(timer, "decode"):
+        img = decode_image(data)
+    if img is None:
+        return None, None
+    if not _batching_enabled():
+        return img, get_faces(img, model, timer=timer)
+    with stage(timer, "detect"):
+        return img, detect_faces(img, model)
+
+
+def get_faces_from_uploads(blobs, model=None, timer=None):
+    """
+    Decodes and analyses several uploaded images in memory on the shared
+    worker pool. Returns one face list per blob, None for unreadable ones,
+    in upload order. With batching on, detection runs per image and the
+    faces of all images are embedded together afterwards.
+    """
+    model = model or get_model()
+    batched = _batching_enabled()
+    results = list(_image_pool.map(lambda data: _analyze_bytes(data, model, timer), blobs))
+    if batched:
+        with stage(timer, "embed"):
+            embed_faces([(img, face) for img, faces in results if faces for face in faces], model)
+    return [faces for _, faces in results]
+
+
+def _detect_crop(data, model, timer=None):
+    with stage(timer, "decode"):
+        img = decode_image(data)
+    if img is None:
+        return None, None
+    # A crop is already one face: search it at the small ROI input size and keep the best box
+    with stage(timer, "detect"):
+        bboxes, kpss = model.det_model.detect(img, input_size=(ROI_DET_SIZE, ROI_DET_SIZE), max_num=1, metric="max")
+    if bboxes.shape[0] == 0:
+        return img, None
+    return img, _build_faces(img, bboxes[:1], kpss[:1] if kpss is not None else None, model)[0]
+
+
+def get_faces_from_crops(blobs, model=None, timer=None):
+    """
+    Embeds pre-cropped face images (one face each). Returns one face per
+    blob in order, None where the crop is unreadable or holds no face.
+    """
+    model = model or get_model()
+    results = list(_image_pool.map(lambda data: _detect_crop(data, model, timer), blobs))
+    with stage(timer, "embed"):
+        embed_faces([(img, face) for img, face in results if face is not None], model)
+    return [face for _, face in results]
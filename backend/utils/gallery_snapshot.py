@@ -0,0 +1,137 @@
+"""
+On-disk gallery snapshot shared by every gunicorn worker on a host.
+
+A snapshot is a float32 .npy matrix of normalised encodings plus a small JSON
+index (rolls, names, departments, sections, version stamp). Workers open the
+matrix with np.load(mmap_mode="r"), so they share the same page-cache pages
+and start without reading every student from Mongo. The CURRENT file names
+the newest snapshot; everything is written to a temp file and renamed, so a
+reader never sees a partial file.
+
+    python -m utils.gallery_snapshot            # write a snapshot from Mongo
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+SNAPSHOT_DIR = os.getenv("GALLERY_SNAPSHOT_DIR")
+SNAPSHOTS_KEPT = 2
+CURRENT_FILE = "CURRENT"
+INDEX_ARRAYS = ("centroids", "vectors", "row_ids", "offsets")
+
+
+def _atomic_write(path, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _stamp_of(meta):
+    return (meta.get("epoch", 0), meta.get("version", 0))
+
+
+def write_snapshot(directory, encodings, meta, index=None):
+    """
+    Writes encodings (already normalised, rows aligned with meta["rolls"]),
+    the JSON index and optionally the IVF arrays, then points CURRENT at them.
+    Returns the snapshot name.
+    """
+    os.makedirs(directory, exist_ok=True)
+    epoch, version = _stamp_of(meta)
+    name = f"gallery-e{epoch}-v{version}-{int(time.time() * 1000)}"
+    base = os.path.join(directory, name)
+
+    matrix = np.ascontiguousarray(encodings, dtype=np.float32)
+    _atomic_write(f"{base}.npy", lambda f: np.save(f, matrix))
+    if index is not None:
+        for field in INDEX_ARRAYS:
+            array = np.ascontiguousarray(getattr(index, field))
+            _atomic_write(f"{base}.ivf-{field}.npy", lambda f, a=array: np.save(f, a))
+
+    watermark = meta.get("watermark")
+    document = {
+        **meta,
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "watermark": watermark.isoformat() if watermark else None,
+        "index": {"n_lists": index.n_lists, "n_probe": index.n_probe} if index is not None else None,
+        "createdAt": datetime.utcnow().isoformat()
+    }
+    _atomic_write(f"{base}.json", lambda f: f.write(json.dumps(document).encode("utf-8")))
+    _atomic_write(os.path.join(directory, CURRENT_FILE), lambda f: f.write(name.encode("utf-8")))
+
+    _prune(directory, keep=name)
+    print(f"Gallery snapshot written: {name} ({matrix.shape[0]} students)")
+    return name
+
+
+def _prune(directory, keep):
+    """Deletes all but the newest snapshots. Workers still mapping them are unaffected."""
+    names = sorted(
+        {f.split(".")[0] for f in os.listdir(directory) if f.startswith("gallery-") and not f.endswith(".tmp")},
+        key=lambda n: int(n.rsplit("-", 1)[-1])
+    )
+    for name in names[:-SNAPSHOTS_KEPT]:
+        if name == keep:
+            continue
+        for f in os.listdir(directory):
+            if f.split(".")[0] == name:
+                try:
+                    os.remove(os.path.join(directory, f))
+                except OSError:
+                    pass
+
+
+def current_snapshot(directory):
+    """Returns the name of the newest snapshot, or None. Costs one small read."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def snapshot_stamp(name):
+    """(epoch, version) parsed from a snapshot name, without opening it."""
+    try:
+        _, epoch, version, _ = name.split("-")
+        return int(epoch[1:]), int(version[1:])
+    except (AttributeError, ValueError):
+        return None
+
+
+def read_snapshot(directory, name=None):
+    """
+    Opens a snapshot read-only. Returns (encodings, meta, index_arrays) where
+    encodings is a memory-mapped float32 matrix and index_arrays is a dict of
+    memory-mapped IVF arrays (or None).
+    """
+    name = name or current_snapshot(directory)
+    if name is None:
+        return None
+    base = os.path.join(directory, name)
+    with open(f"{base}.json") as f:
+        meta = json.load(f)
+    if meta.get("watermark"):
+        meta["watermark"] = datetime.fromisoformat(meta["watermark"])
+
+    encodings = np.load(f"{base}.npy", mmap_mode="r")
+    index_arrays = None
+    if meta.get("index"):
+        index_arrays = {field: np.load(f"{base}.ivf-{field}.npy", mmap_mode="r") for field in INDEX_ARRAYS}
+        index_arrays.update(meta["index"])
+    meta["name"] = name
+    return encodings, meta, index_arrays
+
+
+if __name__ == "__main__":
+    from utils.student_data import _load_gallery_from_db, save_snapshot
+
+    directory = SNAPSHOT_DIR or "gallery_snapshot"
+    save_snapshot(_load_gallery_from_db(), directory)
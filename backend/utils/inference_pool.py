@@ -0,0 +1,83 @@
+"""
+Admission control for model inference.
+
+Every request that runs the face model goes through one InferencePool with a
+fixed number of slots (INFERENCE_SLOTS, each ONNX session sized to its share
+of the cores, see utils.model_loader) and a bounded wait queue
+(INFERENCE_QUEUE). A request that finds the queue full fails fast with
+InferenceOverloaded, which the app turns into 503 + Retry-After, instead of
+piling onto the same cores until every request times out together.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.model_loader import INFERENCE_SLOTS
+
+INFERENCE_QUEUE = int(os.getenv("INFERENCE_QUEUE", "8"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "5"))   # seconds, sent as Retry-After
+
+
+class InferenceOverloaded(Exception):
+    def __init__(self, retry_after=INFERENCE_RETRY_AFTER):
+        super().__init__("Recognition service is busy, retry shortly")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    def __init__(self, slots=INFERENCE_SLOTS, max_queue=INFERENCE_QUEUE):
+        self.slots = slots
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=slots, thread_name_prefix="inference")
+        # Running + waiting jobs; acquiring never blocks, a full pool rejects
+        self._admission = threading.BoundedSemaphore(slots + max_queue)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        self._admission.release()
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Runs fn in an inference slot and waits for it. Returns (result, timings)
+        with timings {"queue_ms", "compute_ms"}. Raises InferenceOverloaded
+        when all slots are busy and the queue is full.
+        """
+        if not self._admission.acquire(blocking=False):
+            raise InferenceOverloaded()
+        with self._lock:
+            self._pending += 1
+
+        submitted = time.perf_counter()
+        marks = {}
+
+        def job():
+            marks["started"] = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                marks["finished"] = time.perf_counter()
+                # Released by the job itself so a slot stays counted while it runs
+                self._release()
+
+        try:
+            future = self._executor.submit(job)
+        except Exception:
+            self._release()
+            raise
+        result = future.result()
+        timings = {
+            "queue_ms": round((marks["started"] - submitted) * 1000, 1),
+            "compute_ms": round((marks["finished"] - marks["started"]) * 1000, 1)
+        }
+        return result, timings
+
+
+inference_pool = InferencePool()
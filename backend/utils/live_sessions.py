@@ -0,0 +1,192 @@
+"""
+Session-scoped live recognition.
+
+The webcam client opens a session and sends frames with its session_id. Each
+session keeps lightweight tracks of the faces it has seen: a detection is
+associated with the track whose box overlaps it most (IoU), or failing that
+whose centre is close enough, since a webcam frame every second or so can
+move a face further than an IoU gate allows. Only new or unconfirmed tracks
+are embedded and matched; a track confirmed as the same student
+TRACK_CONFIRM_HITS times just gets its box updated, so a stable classroom
+costs roughly one detection pass per frame.
+
+Every recognised roll is also accumulated on the session (first-seen time,
+best score), so the attendance can be finalised from that state without
+running the images through the model a second time.
+
+Sessions live in the memory of the worker that opened them; the frame
+endpoint must therefore be served with sticky routing or a single process.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+SESSION_TTL = float(os.getenv("LIVE_SESSION_TTL", "1800"))   # seconds idle before a session is dropped
+TRACK_IOU = float(os.getenv("TRACK_IOU", "0.3"))
+TRACK_CENTROID = 0.5        # max centre distance, as a fraction of the track's box diagonal
+TRACK_CONFIRM_HITS = int(os.getenv("TRACK_CONFIRM_HITS", "2"))
+TRACK_MAX_MISSES = int(os.getenv("TRACK_MAX_MISSES", "5"))   # frames a track survives unseen
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) x1y1x2y2 boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class Track:
+    def __init__(self, track_id, bbox):
+        self.id = track_id
+        self.bbox = bbox
+        self.roll = None
+        self.name = None
+        self.confidence = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def confirmed(self):
+        return self.roll is not None and self.hits >= TRACK_CONFIRM_HITS
+
+    def observe(self, result):
+        """Records one recognition result for this track."""
+        if result["roll"] is not None and result["roll"] == self.roll:
+            self.hits += 1
+            self.confidence = max(self.confidence, result["confidence"])
+        else:
+            self.roll = result["roll"]
+            self.name = result["name"]
+            self.confidence = result["confidence"] if result["roll"] is not None else 0.0
+            self.hits = 1 if result["roll"] is not None else 0
+
+
+class LiveSession:
+    def __init__(self, class_section=None, teacher=None):
+        self.id = uuid.uuid4().hex
+        self.class_section = class_section
+        self.teacher = teacher
+        self.created = time.time()
+        self.last_used = self.created
+        self.tracks = []
+        self.present = {}      # roll -> {"name", "time", "first_seen", "confidence", "hits"}
+        self.frames = 0
+        self._next_track = 1
+        self.lock = threading.Lock()
+
+    def record(self, result):
+        """Adds a recognition result to the present set, keeping first-seen time and best score."""
+        roll = result["roll"]
+        if roll is None:
+            return
+        entry = self.present.get(roll)
+        if entry is None:
+            now = datetime.now()
+            self.present[roll] = {
+                "name": result["name"],
+                "time": now.strftime("%H:%M:%S"),
+                "first_seen": now,
+                "confidence": result["confidence"],
+                "hits": 1
+            }
+        else:
+            entry["confidence"] = max(entry["confidence"], result["confidence"])
+            entry["hits"] += 1
+
+    def associate(self, bboxes):
+        """
+        Assigns each detected box to an existing track (greedy, best IoU first,
+        then nearest centre) or to a new track. Tracks not seen in this frame
+        age and are dropped after TRACK_MAX_MISSES frames.
+        Returns one Track per box.
+        """
+        self.frames += 1
+        self.last_used = time.time()
+        assigned = [None] * len(bboxes)
+        free = list(range(len(self.tracks)))   # indices of tracks not matched yet
+
+        if len(bboxes) and self.tracks:
+            boxes = np.asarray(bboxes, dtype=np.float32)
+            known = np.array([t.bbox for t in self.tracks], dtype=np.float32)
+            ious = iou_matrix(boxes, known)
+            for flat in np.argsort(-ious, axis=None):
+                i, j = np.unravel_index(flat, ious.shape)
+                if ious[i, j] < TRACK_IOU:
+                    break
+                if assigned[i] is None and j in free:
+                    assigned[i] = self.tracks[j]
+                    free.remove(j)
+
+            # Centroid fallback for faces that moved further than the IoU gate
+            centres = (boxes[:, :2] + boxes[:, 2:4]) / 2
+            for i in range(len(bboxes)):
+                if assigned[i] is not None or not free:
+                    continue
+                cand = known[free]
+                dist = np.linalg.norm((cand[:, :2] + cand[:, 2:4]) / 2 - centres[i], axis=1)
+                gate = TRACK_CENTROID * np.linalg.norm(cand[:, 2:4] - cand[:, :2], axis=1)
+                best = int(np.argmin(dist / np.maximum(gate, 1e-6)))
+                if dist[best] <= gate[best]:
+                    assigned[i] = self.tracks[free.pop(best)]
+
+        for j in free:
+            self.tracks[j].misses += 1
+        self.tracks = [t for j, t in enumerate(self.tracks) if j not in free or t.misses <= TRACK_MAX_MISSES]
+
+        for i, bbox in enumerate(bboxes):
+            if assigned[i] is None:
+                assigned[i] = Track(self._next_track, bbox)
+                self._next_track += 1
+                self.tracks.append(assigned[i])
+            assigned[i].bbox = bbox
+            assigned[i].misses = 0
+        return assigned
+
+
+class SessionStore:
+    """Thread-safe in-process registry of live sessions with idle expiry."""
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        stale = [sid for sid, s in self._sessions.items() if now - s.last_used > self.ttl]
+        for sid in stale:
+            del self._sessions[sid]
+
+    def open(self, class_section=None, teacher=None):
+        session = LiveSession(class_section, teacher)
+        with self._lock:
+            self._expire(session.created)
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_used = now
+        return session
+
+    def close(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionStore()
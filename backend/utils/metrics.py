@@ -0,0 +1,125 @@
+"""
+Per-stage latency metrics for the recognition routes.
+
+Each request gets a RequestTimer that accumulates stage durations (decode,
+detect, embed, match, db, report, queue, ...). Stages that run in parallel
+over several images report the summed time of all images. finish() folds the
+stages into per-route histograms, which /metrics renders in the Prometheus
+text format for a local scraper, together with the per-module model timings.
+
+The stage breakdown is returned in responses only when the client asks for
+it (timings=1) or RESPONSE_TIMINGS=1 is set.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from flask import request
+
+RESPONSE_TIMINGS = os.getenv("RESPONSE_TIMINGS", "0") == "1"
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += value
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+def observe(route, stage, ms):
+    with _lock:
+        histogram = _histograms.get((route, stage))
+        if histogram is None:
+            histogram = _histograms[(route, stage)] = Histogram()
+        histogram.observe(ms)
+
+
+def elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+class RequestTimer:
+    """Stage durations of one request. Thread-safe: pool workers add to it too."""
+
+    def __init__(self, route):
+        self.route = route
+        self.timings = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, ms):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, elapsed_ms(start))
+
+    def finish(self):
+        """Records every stage plus the total in the route's histograms. Returns the timings in ms."""
+        self.add("total", elapsed_ms(self._start))
+        for name, ms in self.timings.items():
+            observe(self.route, name, ms)
+        return {name: round(ms, 2) for name, ms in self.timings.items()}
+
+
+def stage(timer, name):
+    """timer.stage(name), or a no-op when the caller has no timer."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+def timings_requested():
+    return RESPONSE_TIMINGS or request.values.get("timings") == "1"
+
+
+def render():
+    """All histograms (and the model module counters) in the Prometheus text format."""
+    from utils.model_loader import module_timings
+
+    lines = [
+        "# HELP attendance_stage_ms Duration of each recognition stage per route, in milliseconds.",
+        "# TYPE attendance_stage_ms histogram"
+    ]
+    with _lock:
+        items = sorted(_histograms.items())
+        for (route, stage_name), histogram in items:
+            labels = f'route="{route}",stage="{stage_name}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'attendance_stage_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'attendance_stage_ms_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"attendance_stage_ms_sum{{{labels}}} {histogram.total:.3f}")
+            lines.append(f"attendance_stage_ms_count{{{labels}}} {histogram.count}")
+
+    modules = module_timings()
+    if modules:
+        lines.append("# HELP model_module_ms_total Wall time spent in each model module, in milliseconds.")
+        lines.append("# TYPE model_module_ms_total counter")
+        for module, stats in sorted(modules.items()):
+            lines.append(f'model_module_ms_total{{module="{module}"}} {stats["total_ms"]}')
+        lines.append("# TYPE model_module_calls_total counter")
+        for module, stats in sorted(modules.items()):
+            lines.append(f'model_module_calls_total{{module="{module}"}} {stats["calls"]}')
+    return "\n".join(lines) + "\n"
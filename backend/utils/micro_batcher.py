@@ -0,0 +1,77 @@
+"""
+Cross-request micro-batching for the recognition model.
+
+Concurrent requests each hand their aligned face crops to one MicroBatcher.
+A single thread takes the first waiting request, keeps collecting crops from
+other requests for at most max_wait_ms after it arrived (or until max_batch
+crops are gathered), runs them as one ONNX batch and hands every request
+back its own slice of the embeddings. A request therefore waits at most
+max_wait_ms longer than it would alone, while busy hosts run fewer, larger
+batches per core.
+
+Batching only spans requests that reach the embedding stage at the same
+time, so it pays off with INFERENCE_SLOTS > 1 and many live classrooms.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch=32, max_wait_ms=5):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="micro-batcher")
+        self._thread.start()
+
+    def submit(self, crops):
+        """Embeds crops, sharing an ONNX call with concurrent requests. Blocks until done."""
+        if len(crops) >= self.max_batch:
+            # Already a full batch on its own
+            return self.fn(crops)
+        future = Future()
+        self._queue.put((crops, future, time.perf_counter()))
+        return future.result()
+
+    @property
+    def mean_batch(self):
+        return self.items / self.batches if self.batches else 0.0
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            pending = [first]
+            count = len(first[0])
+            deadline = first[2] + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+            self._run(pending)
+
+    def _run(self, pending):
+        crops = [crop for item in pending for crop in item[0]]
+        try:
+            feats = self.fn(crops)
+        except Exception as e:
+            for _, future, _ in pending:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(crops)
+        offset = 0
+        for item_crops, future, _ in pending:
+            future.set_result(feats[offset:offset + len(item_crops)])
+            offset += len(item_crops)
@@ -1,7 +1,175 @@
 import insightface
+import onnxruntime
 import os
+import threading
+import time
+
+from utils.model_packs import FACE_MODEL_PACK, MODEL_ROOT
+
+# Only bbox + embedding are used, so landmarks / gender-age are skipped by default.
+# FACE_MODULES=all loads every module in the pack.
+DEFAULT_MODULES = ("detection", "recognition")
+FACE_MODULES = os.getenv("FACE_MODULES", ",".join(DEFAULT_MODULES))
+
+# Concurrent inference slots (see utils.inference_pool) share the cores with
+# the other gunicorn workers. Each slot fans detection out over the image and
+# tile pools (utils.face_pipeline), so up to INFERENCE_SLOTS * INFERENCE_FANOUT
+# model calls run at once per process; a gate in every instrumented call holds
+# it to exactly that. Each ONNX session gets
+# cpu_count // (WEB_CONCURRENCY * INFERENCE_SLOTS * INFERENCE_FANOUT) intra-op
+# threads unless ONNX_THREADS is set, instead of onnxruntime's default of one
+# per core, so the cores are never oversubscribed.
+INFERENCE_SLOTS = max(1, int(os.getenv("INFERENCE_SLOTS", "2")))
+INFERENCE_FANOUT = max(1, int(os.getenv("INFERENCE_FANOUT", "2")))   # parallel model calls per slot
+WEB_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))   # gunicorn's own worker-count variable
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+ONNX_INTER_THREADS = int(os.getenv("ONNX_INTER_THREADS", "1"))
+ONNX_GRAPH_OPT = os.getenv("ONNX_GRAPH_OPT", "all")                  # disabled | basic | extended | all
+ONNX_EXECUTION_MODE = os.getenv("ONNX_EXECUTION_MODE", "sequential")  # sequential | parallel
+ONNX_MEM_ARENA = os.getenv("ONNX_MEM_ARENA", "1") == "1"
+ONNX_MEM_PATTERN = os.getenv("ONNX_MEM_PATTERN", "1") == "1"
+ONNX_PROVIDERS = [p.strip() for p in os.getenv("ONNX_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+
+GRAPH_OPT_LEVELS = {
+    "disabled": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL
+}
 
 _model = None
+_timings = {}
+_timings_lock = threading.Lock()
+_onnx_gate = threading.BoundedSemaphore(INFERENCE_SLOTS * INFERENCE_FANOUT)
+
+
+def parse_modules(value):
+    """'detection,recognition' -> ['detection', 'recognition'], 'all' -> None (every module)."""
+    if value is None or value.strip().lower() == "all":
+        return None
+    modules = [m.strip() for m in value.split(",") if m.strip()]
+    if "detection" not in modules:
+        modules.insert(0, "detection")
+    return modules
+
+
+def _record(module, seconds):
+    with _timings_lock:
+        entry = _timings.setdefault(module, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+
+def set_inference_gate(calls):
+    """Replaces the cap on concurrent model calls, e.g. for a benchmark choosing its own concurrency."""
+    global _onnx_gate
+    _onnx_gate = threading.BoundedSemaphore(max(1, calls))
+
+
+def _timed(module, fn):
+    # The wrapped calls are leaves (they never wait on another model call), so gating them cannot deadlock
+    def wrapper(*args, **kwargs):
+        with _onnx_gate:
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(module, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument(model):
+    """
+    Wraps every module of a FaceAnalysis instance so each call passes the
+    process-wide model-call gate and records its wall time. Recognition is
+    wrapped at get_feat, which both the per-face and the batched path go
+    through.
+    """
+    for taskname, task_model in model.models.items():
+        if taskname == "detection":
+            task_model.detect = _timed(taskname, task_model.detect)
+        elif taskname == "recognition":
+            task_model.get_feat = _timed(taskname, task_model.get_feat)
+        else:
+            task_model.get = _timed(taskname, task_model.get)
+    return model
+
+
+def module_timings(reset=False):
+    """{module: {"calls", "total_ms", "mean_ms", "max_ms"}} since start (or the last reset)."""
+    with _timings_lock:
+        report = {
+            module: {
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / calls, 3) if calls else 0.0,
+                "max_ms": round(peak * 1000, 3)
+            }
+            for module, (calls, total, peak) in _timings.items()
+        }
+        if reset:
+            _timings.clear()
+    return report
+
+
+def thread_budget(slots=INFERENCE_SLOTS, workers=WEB_WORKERS, fanout=INFERENCE_FANOUT):
+    return ONNX_THREADS or max(1, (os.cpu_count() or 1) // (slots * workers * fanout))
+
+
+def onnx_config(**overrides):
+    """Session settings from the environment, with keyword overrides (used by the benchmark)."""
+    config = {
+        "intra_threads": thread_budget(),
+        "inter_threads": ONNX_INTER_THREADS,
+        "graph_opt": ONNX_GRAPH_OPT,
+        "execution_mode": ONNX_EXECUTION_MODE,
+        "mem_arena": ONNX_MEM_ARENA,
+        "mem_pattern": ONNX_MEM_PATTERN
+    }
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    return config
+
+
+def session_options(config=None):
+    config = config or onnx_config()
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = config["intra_threads"]
+    options.inter_op_num_threads = config["inter_threads"]
+    options.graph_optimization_level = GRAPH_OPT_LEVELS[config["graph_opt"]]
+    options.execution_mode = EXECUTION_MODES[config["execution_mode"]]
+    options.enable_cpu_mem_arena = config["mem_arena"]
+    options.enable_mem_pattern = config["mem_pattern"]
+    return options
+
+
+def apply_session_options(model, options):
+    """
+    Re-creates every module's ONNX session with the given options.
+    FaceAnalysis only forwards providers to onnxruntime, not SessionOptions.
+    """
+    for task_model in model.models.values():
+        providers = task_model.session.get_providers()
+        task_model.session = onnxruntime.InferenceSession(task_model.model_file, sess_options=options, providers=providers)
+    return model
+
+
+def load_model(modules=None, det_size=(640, 640), options=None, pack=None):
+    """Builds and prepares a FaceAnalysis (FACE_MODEL_PACK by default) restricted to the given modules."""
+    model = insightface.app.FaceAnalysis(
+        name=pack or FACE_MODEL_PACK,
+        root=MODEL_ROOT,
+        allowed_modules=modules,
+        providers=ONNX_PROVIDERS
+    )
+    model.prepare(ctx_id=-1, det_size=det_size)
+    apply_session_options(model, options or session_options())
+    return instrument(model)
+
 
 def get_model():
     """
@@ -10,11 +178,8 @@ def get_model():
     """
     global _model
     if _model is None:
-        print(">>> Loading AI Model (buffalo_s Singleton) <<<")
+        modules = parse_modules(FACE_MODULES)
+        print(f">>> Loading AI Model ({FACE_MODEL_PACK} Singleton, modules: {modules or 'all'}, onnx: {onnx_config()}) <<<")
         # buffalo_s is a smaller, faster ensemble than buffalo_l (512MB RAM safe)
-        _model = insightface.app.FaceAnalysis(
-            name="buffalo_s", 
-            providers=['CPUExecutionProvider']
-        )
-        _model.prepare(ctx_id=-1, det_size=(640, 640))
+        _model = load_model(modules)
     return _model
@@ -0,0 +1,38 @@
+"""
+Model pack names, readable without loading insightface or onnxruntime.
+
+A pack written by utils.quantize_models carries a pack.json manifest naming
+the pack its recognition model comes from: a pack with only the detector
+quantised keeps the FP32 recognition model, so its embeddings stay
+comparable with (and are stored under the same modelVersion as) the source
+pack's. Stock packs have no manifest and are their own recognition version.
+"""
+import json
+import os
+
+# Model pack under MODEL_ROOT/models/, e.g. buffalo_s_int8 written by utils.quantize_models
+FACE_MODEL_PACK = os.getenv("FACE_MODEL_PACK", "buffalo_s")
+MODEL_ROOT = os.path.expanduser(os.getenv("INSIGHTFACE_ROOT", "~/.insightface"))
+PACK_MANIFEST = "pack.json"
+
+
+def pack_dir(pack):
+    return os.path.join(MODEL_ROOT, "models", pack)
+
+
+def read_manifest(pack):
+    """The pack's manifest, {} for stock packs."""
+    try:
+        with open(os.path.join(pack_dir(pack), PACK_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def recognition_version(pack=FACE_MODEL_PACK):
+    """Name of the pack whose recognition model the given pack uses."""
+    return read_manifest(pack).get("recognition", pack)
+
+
+# modelVersion of the embeddings this process computes
+RECOGNITION_MODEL_VERSION = recognition_version()
@@ -0,0 +1,147 @@
+"""
+INT8 variants of the buffalo_s detection and ArcFace models.
+
+    python -m utils.quantize_models                                   # dynamic -> buffalo_s_int8
+    python -m utils.quantize_models --static --calibration group_photos
+    python -m utils.quantize_models --modules detection               # -> buffalo_s_det_int8
+
+Writes a new model pack next to the FP32 one: the detection and/or
+recognition ONNX files are replaced by quantised versions, every other file
+is copied unchanged, and a pack.json manifest (see utils.model_packs) names
+the pack the recognition model comes from. Check it with
+benchmarks.quantization_accuracy, then select it with FACE_MODEL_PACK.
+
+Embeddings are stored with their recognition model as modelVersion and the
+gallery only loads the active one's. A detector-only pack keeps the source
+recognition model, so it can be adopted without touching enrolled students;
+a pack with INT8 recognition skips (with a warning) every student registered
+under FP32 until they are registered again, unless the accuracy benchmark
+shows INT8 probes still match the FP32 gallery.
+"""
+import argparse
+import json
+import os
+import shutil
+
+import cv2
+import numpy as np
+from insightface.utils import face_align
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+from utils.model_loader import load_model
+from utils.model_packs import PACK_MANIFEST, pack_dir, recognition_version
+
+QUANTIZED_MODULES = ("detection", "recognition")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+QUANT_TYPES = {"uint8": QuantType.QUInt8, "int8": QuantType.QInt8}
+
+
+class BlobReader(CalibrationDataReader):
+    """Feeds preprocessed calibration tensors to quantize_static."""
+
+    def __init__(self, input_name, blobs):
+        self.input_name = input_name
+        self._blobs = iter(blobs)
+
+    def get_next(self):
+        blob = next(self._blobs, None)
+        return None if blob is None else {self.input_name: blob}
+
+
+def _read_images(directory):
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            img = cv2.imread(os.path.join(directory, name))
+            if img is not None:
+                yield img
+
+
+def _detection_blobs(model, images):
+    # Same letterboxing as the SCRFD detector applies before inference
+    det = model.models["detection"]
+    width, height = model.det_size
+    for img in images:
+        if img.shape[0] / img.shape[1] > height / width:
+            new_h, new_w = height, int(height * img.shape[1] / img.shape[0])
+        else:
+            new_w, new_h = width, int(width * img.shape[0] / img.shape[1])
+        canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        canvas[:new_h, :new_w] = cv2.resize(img, (new_w, new_h))
+        yield cv2.dnn.blobFromImage(canvas, 1.0 / det.input_std, (width, height), (det.input_mean,) * 3, swapRB=True)
+
+
+def _recognition_blobs(model, images):
+    # Aligned crops of every face the FP32 model finds
+    rec = model.models["recognition"]
+    for img in images:
+        for face in model.get(img):
+            crop = face_align.norm_crop(img, landmark=face.kps, image_size=rec.input_size[0])
+            yield cv2.dnn.blobFromImages([crop], 1.0 / rec.input_std, rec.input_size, (rec.input_mean,) * 3, swapRB=True)
+
+
+def quantize_pack(source, target, static=False, calibration=None, weight_type="uint8", per_channel=False,
+                  modules=QUANTIZED_MODULES):
+    """
+    Writes MODEL_ROOT/models/<target> from <source>, quantising the given
+    modules. Returns {module: (fp32 bytes, int8 bytes)}.
+    """
+    src_dir, dst_dir = pack_dir(source), pack_dir(target)
+    fp32 = load_model(list(QUANTIZED_MODULES), pack=source)
+    quantized = {fp32.models[t].model_file: t for t in modules}
+
+    os.makedirs(dst_dir, exist_ok=True)
+    for name in os.listdir(src_dir):
+        path = os.path.join(src_dir, name)
+        if path not in quantized and name != PACK_MANIFEST and os.path.isfile(path):
+            shutil.copy2(path, os.path.join(dst_dir, name))
+
+    images = list(_read_images(calibration)) if static else []
+    sizes = {}
+    for model_file, taskname in quantized.items():
+        out_file = os.path.join(dst_dir, os.path.basename(model_file))
+        if static:
+            blobs = _detection_blobs(fp32, images) if taskname == "detection" else _recognition_blobs(fp32, images)
+            reader = BlobReader(fp32.models[taskname].input_name, list(blobs))
+            quantize_static(
+                model_file, out_file, reader,
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QUANT_TYPES[weight_type],
+                per_channel=per_channel
+            )
+        else:
+            quantize_dynamic(model_file, out_file, weight_type=QUANT_TYPES[weight_type], per_channel=per_channel)
+        sizes[taskname] = (os.path.getsize(model_file), os.path.getsize(out_file))
+        print(f"{taskname}: {os.path.basename(model_file)} {sizes[taskname][0] / 1e6:.1f} MB -> {sizes[taskname][1] / 1e6:.1f} MB")
+
+    manifest = {
+        "source": source,
+        "quantized": list(modules),
+        # An untouched recognition model keeps the source's embedding version
+        "recognition": target if "recognition" in modules else recognition_version(source)
+    }
+    with open(os.path.join(dst_dir, PACK_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote model pack {dst_dir} (embeddings: {manifest['recognition']})")
+    return sizes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="buffalo_s")
+    parser.add_argument("--target", help="default: <source>_int8, <source>_det_int8 for --modules detection")
+    parser.add_argument("--modules", default=",".join(QUANTIZED_MODULES),
+                        help="comma-separated modules to quantise: detection, recognition")
+    parser.add_argument("--static", action="store_true", help="static (calibrated) instead of dynamic quantisation")
+    parser.add_argument("--calibration", default="group_photos", help="image folder for --static")
+    parser.add_argument("--weight-type", choices=sorted(QUANT_TYPES), default="uint8")
+    parser.add_argument("--per-channel", action="store_true")
+    args = parser.parse_args()
+
+    modules = tuple(m.strip() for m in args.modules.split(",") if m.strip())
+    unknown = set(modules) - set(QUANTIZED_MODULES)
+    if not modules or unknown:
+        parser.error(f"--modules must be a subset of {','.join(QUANTIZED_MODULES)}")
+    default_target = f"{args.source}_det_int8" if modules == ("detection",) else f"{args.source}_int8"
+    quantize_pack(args.source, args.target or default_target, args.static, args.calibration,
+                  args.weight_type, args.per_channel, modules)
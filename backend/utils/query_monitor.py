@@ -0,0 +1,116 @@
+"""
+Per-request MongoDB query accounting.
+
+A pymongo CommandListener attributes every command to the Flask request
+that issued it and keeps the count, the total server round-trip time and the
+slowest command. After each request the numbers go out as an X-DB-Queries
+header (plus a Server-Timing entry for the browser dev tools), and requests
+issuing more than QUERY_COUNT_THRESHOLD commands are logged as likely N+1
+patterns. QUERY_LOG=1 logs every request.
+
+pymongo only hands listeners to clients created after monitoring.register(),
+and the route modules create their MongoClients at import time, so this
+module registers its listener on import: app.py imports it before any route.
+Commands issued from worker threads (inference pool, gallery sync) have no
+request context and are not attributed.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+# Imported ahead of app.py's own load_dotenv()
+load_dotenv()
+QUERY_MONITOR = os.getenv("QUERY_MONITOR", "1") == "1"
+QUERY_COUNT_THRESHOLD = int(os.getenv("QUERY_COUNT_THRESHOLD", "25"))
+QUERY_LOG = os.getenv("QUERY_LOG", "0") == "1"
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = None   # (ms, "command collection")
+        self.failed = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, request_id, label):
+        with self._lock:
+            self._pending[request_id] = label
+
+    def finished(self, request_id, command_name, duration_micros, failed=False):
+        ms = duration_micros / 1000
+        with self._lock:
+            label = self._pending.pop(request_id, command_name)
+            self.count += 1
+            self.total_ms += ms
+            if failed:
+                self.failed += 1
+            if self.slowest is None or ms > self.slowest[0]:
+                self.slowest = (ms, label)
+
+    def header(self):
+        text = f"count={self.count}; total_ms={self.total_ms:.1f}"
+        if self.slowest:
+            text += f"; slowest={self.slowest[1]} {self.slowest[0]:.1f}ms"
+        return text
+
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get("query_stats")
+
+
+class RequestQueryListener(monitoring.CommandListener):
+    def started(self, event):
+        stats = _current_stats()
+        if stats is not None:
+            collection = event.command.get(event.command_name)
+            label = f"{event.command_name} {collection}" if isinstance(collection, str) else event.command_name
+            stats.started(event.request_id, label)
+
+    def succeeded(self, event):
+        stats = _current_stats()
+        if stats is not None:
+            stats.finished(event.request_id, event.command_name, event.duration_micros)
+
+    def failed(self, event):
+        stats = _current_stats()
+        if stats is not None:
+            stats.finished(event.request_id, event.command_name, event.duration_micros, failed=True)
+
+
+if QUERY_MONITOR:
+    monitoring.register(RequestQueryListener())
+
+
+def _start_request():
+    g.query_stats = QueryStats()
+
+
+def _finish_request(response):
+    stats = g.get("query_stats")
+    if stats is None or stats.count == 0:
+        return response
+    response.headers["X-DB-Queries"] = stats.header()
+    response.headers.add("Server-Timing", f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"')
+
+    flagged = stats.count > QUERY_COUNT_THRESHOLD
+    if flagged or QUERY_LOG:
+        marker = "!!! N+1? " if flagged else ""
+        print(f"{marker}[db] {request.method} {request.path}: {stats.header()}"
+              + (f", {stats.failed} failed" if stats.failed else ""))
+    return response
+
+
+def init_query_monitor(app):
+    """Hooks the per-request counters into the app (the listener is already registered)."""
+    if not QUERY_MONITOR:
+        print("QUERY_MONITOR=0: per-request query accounting disabled")
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,78 @@
+# Student roster helpers. Roster reads never need the face embeddings,
+# which live in their own collection (see utils.embedding_codec).
+import re
+
+# Projection for roster queries: identity and placement fields only
+ROSTER_FIELDS = {"rollNo": 1, "name": 1, "department": 1, "section": 1}
+# What an attendance session needs from its section's roster
+SECTION_ROSTER_FIELDS = {"_id": 0, "rollNo": 1, "name": 1, "section": 1}
+
+
+def _section_code(class_section):
+    # "Java Programming (AIML-B)" -> "AIML-B"
+    match = re.search(r'\((.*?)\)', class_section)
+    return match.group(1) if match else class_section
+
+
+class SectionRoster:
+    """
+    The students expected in one class section, read with a single query
+    when an attendance session is saved and reused for the absent list, the
+    attendance records and the Excel report.
+    """
+
+    def __init__(self, class_section, students):
+        self.class_section = class_section
+        self.students = {str(s["rollNo"]): s for s in students}
+
+    @classmethod
+    def load(cls, students_col, class_section):
+        """Reads the roster of "Course (DEPT-SEC)", "DEPT-SEC" or a bare section name."""
+        if "-" in class_section:
+            dept, sec = _section_code(class_section).split("-", 1)
+            query = {"department": dept, "section": sec}
+        else:
+            query = {"section": class_section}
+
+        students = list(students_col.find(query, SECTION_ROSTER_FIELDS))
+        # Fallback for students stored with the combined code as their section
+        if not students and "(" in class_section:
+            students = list(students_col.find({"section": _section_code(class_section)}, SECTION_ROSTER_FIELDS))
+        return cls(class_section, students)
+
+    @property
+    def rolls(self):
+        return set(self.students)
+
+    def __len__(self):
+        return len(self.students)
+
+    def name(self, roll, default="Unknown"):
+        student = self.students.get(str(roll))
+        return student.get("name", default) if student else default
+
+    def absent_rolls(self, present_rolls):
+        return sorted(self.rolls - set(present_rolls))
+
+    @property
+    def section_label(self):
+        # Value stored in attendance records' "section" field
+        if "-" in self.class_section:
+            return self.class_section.split("-")[-1].replace(")", "")
+        return self.class_section
+
+    def records(self, attendance, absent_rolls, **fields):
+        """
+        Attendance documents for the present ({roll: {"name", "time"}}) and
+        absent students; fields (date, subject, type, faculty...) are shared.
+        """
+        base = {"className": self.class_section, "section": self.section_label, **fields}
+        records = [
+            {"rollNo": roll, "name": entry["name"], **base, "status": "present", "time": entry["time"]}
+            for roll, entry in attendance.items()
+        ]
+        records.extend(
+            {"rollNo": roll, "name": self.name(roll), **base, "status": "absent", "time": None}
+            for roll in absent_rolls
+        )
+        return records
@@ -1,44 +1,513 @@
 import numpy as np
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from numpy.linalg import norm
+
+from utils.face_matcher import normalize_rows
+from utils.ann_index import IVFIndex, build_ann_index
+from utils import gallery_snapshot
+from utils.embedding_codec import (
+    decode_embedding, model_version_filter, EMBEDDINGS_COLLECTION, EMBEDDING_MODEL, EMBEDDING_MODEL_VERSION,
+    LEGACY_MODEL_VERSION
+)
+from utils.roster import ROSTER_FIELDS
 
 load_dotenv()
 
+EMBEDDING_DIM = 512
+# Seconds between two version checks against gallery_meta
+GALLERY_SYNC_INTERVAL = float(os.getenv("GALLERY_SYNC_INTERVAL", "2"))
+# registeredAt is stamped by the registering worker before its writes, so
+# registrations can commit out of timestamp order (and worker clocks drift).
+# Each delta re-reads this many seconds before the watermark; it must exceed
+# the clock skew between workers plus the time a registration takes to commit.
+GALLERY_SYNC_OVERLAP = float(os.getenv("GALLERY_SYNC_OVERLAP", "300"))
+GALLERY_META_ID = "students"
+EMBEDDING_FIELDS = {"_id": 0, "rollNo": 1, "encoding": 1, "dtype": 1, "registeredAt": 1}
+# Students registered before the embeddings collection still carry face_encoding
+LEGACY_EMBEDDING_FIELDS = {
+    "_id": 0, "rollNo": 1, "face_encoding": 1, "face_encoding_dtype": 1, "registeredAt": 1
+}
+
 _student_data = None
+_db = None
+_load_lock = threading.Lock()
+# One sync (or local change) at a time: a delta applied twice would race on the watermark
+_sync_lock = threading.Lock()
+_last_sync = 0.0
+
+def _get_db():
+    global _db
+    if _db is None:
+        _db = MongoClient(os.getenv("MONGO_URI"))["AttendanceDB"]
+    return _db
+
+def parse_section_code(class_section):
+    """
+    Splits a class label into (department, section).
+    "Java Programming (AIML-B)" -> ("AIML", "B"), "AIML-B" -> ("AIML", "B"), "B" -> (None, "B").
+    """
+    if not class_section:
+        return None, None
+    match = re.search(r'\((.*?)\)', class_section)
+    sec_code = match.group(1) if match else class_section
+    if "-" in sec_code:
+        dept, sec = sec_code.split("-", 1)
+        return dept.strip(), sec.strip()
+    return None, sec_code.strip()
+
+def build_partitions(departments, sections):
+    """Groups gallery row indices by (department, section)."""
+    groups = {}
+    for idx, key in enumerate(zip(departments, sections)):
+        groups.setdefault(key, []).append(idx)
+    return {key: np.array(rows, dtype=np.int64) for key, rows in groups.items()}
+
+def get_partition_rows(data, class_section):
+    """
+    Returns the gallery row indices of the roster named by class_section,
+    or None when the hint is missing or matches no partition.
+    Students stored with a combined section ("AIML-B") are included as well.
+    """
+    dept, sec = parse_section_code(class_section)
+    if sec is None:
+        return None
+
+    combined = f"{dept}-{sec}" if dept else None
+    rows = [
+        part_rows for (p_dept, p_sec), part_rows in list(data.partitions.items())
+        if (p_sec == sec and (dept is None or p_dept == dept)) or (combined and p_sec == combined)
+    ]
+    rows = [r for r in rows if len(r)]
+    if not rows:
+        return None
+    return np.concatenate(rows)
+
+
+class StudentGallery:
+    """
+    In-process gallery of normalised ArcFace encodings.
+    Rows live in a preallocated float32 buffer that grows geometrically, so
+    registering a student writes one row instead of restacking the matrix.
+    Replaced or removed students are tombstoned (zeroed and marked inactive)
+    until the next full reload compacts the buffer.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self._buffer = np.zeros((0, dim), dtype=np.float32)
+        self._active = np.zeros(0, dtype=bool)
+        self.size = 0
+        self.names, self.rolls, self.departments, self.sections = [], [], [], []
+        self.partitions = {}
+        self.index = None
+        self._row_of = {}
+        self._lock = threading.Lock()
+        # Sync state against the gallery_meta document
+        self.version = 0
+        self.epoch = 0
+        self.watermark = None
+        self.snapshot = None
+        # registeredAt of the rows pulled from Mongo, so the overlap re-read skips them
+        self.stamps = {}
+
+    @property
+    def encodings(self):
+        return self._buffer[:self.size]
+
+    @property
+    def active(self):
+        return self._active[:self.size]
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def __contains__(self, roll):
+        return str(roll) in self._row_of
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= self._buffer.shape[0]:
+            return
+        capacity = max(needed, 2 * self._buffer.shape[0], 64)
+        buffer = np.zeros((capacity, self.dim), dtype=np.float32)
+        buffer[:self.size] = self.encodings
+        active = np.zeros(capacity, dtype=bool)
+        active[:self.size] = self.active
+        # Readers holding the old views keep a consistent (older) gallery
+        self._buffer, self._active = buffer, active
+
+    def load(self, names, rolls, departments, sections, encodings, build_index=True):
+        """Bulk-fills an empty gallery, normalising all rows at once."""
+        with self._lock:
+            count = len(rolls)
+            self._reserve(count)
+            if count:
+                self._buffer[:count] = normalize_rows(encodings)
+                self._active[:count] = True
+            self.names, self.rolls = list(names), [str(r) for r in rolls]
+            self.departments, self.sections = list(departments), list(sections)
+            self._row_of = {roll: row for row, roll in enumerate(self.rolls)}
+            self.size = count
+            self.partitions = build_partitions(self.departments, self.sections)
+            self.index = build_ann_index(self.encodings) if build_index else None
+        return self
+
+    def attach(self, names, rolls, departments, sections, encodings, index=None):
+        """
+        Adopts an already normalised matrix without copying it, e.g. a
+        read-only memory-mapped snapshot. It is copied on the first write.
+        """
+        with self._lock:
+            count = encodings.shape[0]
+            self._buffer = encodings
+            self._active = np.ones(count, dtype=bool)
+            self.names, self.rolls = list(names), [str(r) for r in rolls]
+            self.departments, self.sections = list(departments), list(sections)
+            self._row_of = {roll: row for row, roll in enumerate(self.rolls)}
+            self.size = count
+            self.partitions = build_partitions(self.departments, self.sections)
+            self.index = index
+        return self
+
+    def _ensure_writable(self):
+        if not self._buffer.flags.writeable:
+            self._buffer = np.array(self._buffer, dtype=np.float32)
+
+    def append(self, roll, name, department, section, encoding):
+        """Adds one student; an existing row for the same roll is replaced."""
+        roll = str(roll)
+        with self._lock:
+            if roll in self._row_of:
+                self._tombstone(self._row_of.pop(roll))
+            self._reserve(1)
+            self._ensure_writable()
+            row = self.size
+            self._buffer[row] = normalize_rows(encoding)[0]
+            self._active[row] = True
+            self.names.append(name)
+            self.rolls.append(roll)
+            self.departments.append(department)
+            self.sections.append(section)
+            self._row_of[roll] = row
+
+            key = (department, section)
+            self.partitions[key] = np.append(self.partitions.get(key, np.empty(0, dtype=np.int64)), row)
+            # Publish the row last so readers never see it half-written
+            self.size = row + 1
+            return row
+
+    def update(self, roll, encoding=None, name=None, department=None, section=None):
+        """Replaces fields of an existing student. Returns the new row or None."""
+        roll = str(roll)
+        row = self._row_of.get(roll)
+        if row is None:
+            return None
+        return self.append(
+            roll,
+            name if name is not None else self.names[row],
+            department if department is not None else self.departments[row],
+            section if section is not None else self.sections[row],
+            encoding if encoding is not None else self.encodings[row].copy()
+        )
+
+    def remove(self, roll):
+        with self._lock:
+            row = self._row_of.pop(str(roll), None)
+            if row is None:
+                return False
+            self._tombstone(row)
+            self.stamps.pop(str(roll), None)
+            return True
+
+    def _tombstone(self, row):
+        self._ensure_writable()
+        self._active[row] = False
+        self._buffer[row] = 0.0
+        key = (self.departments[row], self.sections[row])
+        if key in self.partitions:
+            self.partitions[key] = self.partitions[key][self.partitions[key] != row]
+
+    def apply_embedding(self, embedding, student):
+        """
+        Upserts one embeddings-collection document with its roster entry.
+        The watermark is left alone: it only moves to registeredAt values
+        read back from Mongo (see sync_student_data).
+        """
+        row = self.append(
+            str(embedding["rollNo"]),
+            student.get("name"),
+            student.get("department"),
+            student.get("section"),
+            decode_embedding(embedding["encoding"], embedding.get("dtype"))
+        )
+        self.stamps[str(embedding["rollNo"])] = embedding.get("registeredAt")
+        return row
+
+
+def _read_meta(db):
+    return db["gallery_meta"].find_one({"_id": GALLERY_META_ID}) or {}
+
+def _iter_embeddings(db, since=None):
+    """
+    Yields (rollNo, encoding, dtype, registeredAt) from the embeddings
+    collection, then from students not yet migrated out of the roster.
+    """
+    query = {"model": EMBEDDING_MODEL, "modelVersion": model_version_filter()}
+    if since is not None:
+        query["registeredAt"] = {"$gte": since}
+    seen = set()
+    for doc in db[EMBEDDINGS_COLLECTION].find(query, EMBEDDING_FIELDS):
+        seen.add(str(doc["rollNo"]))
+        yield str(doc["rollNo"]), doc["encoding"], doc.get("dtype"), doc.get("registeredAt")
+
+    legacy = {**query, "face_encoding": {"$exists": True}}
+    for doc in db["students"].find(legacy, LEGACY_EMBEDDING_FIELDS):
+        if str(doc["rollNo"]) not in seen:
+            yield str(doc["rollNo"]), doc["face_encoding"], doc.get("face_encoding_dtype"), doc.get("registeredAt")
+
+def _count_embeddings(db, version_filter=None):
+    query = {"model": EMBEDDING_MODEL, "modelVersion": version_filter or model_version_filter()}
+    return db[EMBEDDINGS_COLLECTION].count_documents(query) + \
+        db["students"].count_documents({**query, "face_encoding": {"$exists": True}})
+
+def _warn_other_versions(db):
+    # Embeddings of another recognition model are skipped: those students need re-registering
+    current = model_version_filter()
+    other = {"$nin": current["$in"]} if isinstance(current, dict) else {"$ne": current}
+    skipped = _count_embeddings(db, other)
+    if skipped:
+        print(f"Warning: {skipped} embedding(s) from another recognition model skipped, gallery uses "
+              f"{EMBEDDING_MODEL_VERSION}; those students must register again")
+
+def _load_gallery_from_db(meta=None):
+    print(">>> Loading Student Data (Singleton) <<<")
+    db = _get_db()
+    # Read the version first: anything registered meanwhile is re-pulled as delta
+    meta = meta if meta is not None else _read_meta(db)
+    roster = {str(doc["rollNo"]): doc for doc in db["students"].find({}, ROSTER_FIELDS)}
+    _warn_other_versions(db)
+
+    # Decode straight into a preallocated matrix, grown only if students arrive meanwhile
+    matrix = np.empty((_count_embeddings(db), EMBEDDING_DIM), dtype=np.float32)
+    names, rolls, departments, sections = [], [], [], []
+    stamps = {}
+    watermark = None
+    for roll, encoding, dtype, registered_at in _iter_embeddings(db):
+        student = roster.get(roll)
+        if student is None:
+            continue
+        row = len(rolls)
+        if row == matrix.shape[0]:
+            matrix = np.concatenate([matrix, np.empty_like(matrix[:max(row, 64)])])
+        decode_embedding(encoding, dtype, out=matrix[row])
+        names.append(student.get("name"))
+        rolls.append(roll)
+        departments.append(student.get("department"))
+        sections.append(student.get("section"))
+        stamps[roll] = registered_at
+        if registered_at and (watermark is None or registered_at > watermark):
+            watermark = registered_at
+
+    # Normalise in place, the matrix becomes the gallery buffer as is
+    matrix = matrix[:len(rolls)]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+
+    gallery = StudentGallery().attach(names, rolls, departments, sections, matrix, build_ann_index(matrix))
+    gallery.version = meta.get("version", 0)
+    gallery.epoch = meta.get("epoch", 0)
+    gallery.watermark = watermark
+    gallery.stamps = stamps
+    return gallery
+
+def _load_gallery_from_snapshot(directory, name=None):
+    snapshot = gallery_snapshot.read_snapshot(directory, name)
+    if snapshot is None:
+        return None
+    encodings, meta, index_arrays = snapshot
+    built_with = meta.get("modelVersion", LEGACY_MODEL_VERSION)
+    if built_with != EMBEDDING_MODEL_VERSION:
+        print(f"Gallery snapshot {meta['name']} holds {built_with} embeddings, loading from Mongo")
+        return None
+    index = IVFIndex.from_arrays(index_arrays) if index_arrays else None
+    gallery = StudentGallery(dim=encodings.shape[1]).attach(
+        meta["names"], meta["rolls"], meta["departments"], meta["sections"], encodings, index
+    )
+    gallery.version = meta.get("version", 0)
+    gallery.epoch = meta.get("epoch", 0)
+    gallery.watermark = meta.get("watermark")
+    gallery.snapshot = meta["name"]
+    print(f">>> Student Data mapped from snapshot {meta['name']} ({gallery.size} students) <<<")
+    return gallery
+
+def save_snapshot(gallery, directory):
+    """Writes the active rows of gallery as the host's current snapshot."""
+    rows = np.flatnonzero(gallery.active)
+    compact = rows.size == gallery.size
+    encodings = gallery.encodings if compact else gallery.encodings[rows]
+    index = gallery.index
+    if not compact or (index is not None and index.size != gallery.size):
+        index = build_ann_index(encodings)
+    meta = {
+        "version": gallery.version,
+        "epoch": gallery.epoch,
+        "watermark": gallery.watermark,
+        "modelVersion": EMBEDDING_MODEL_VERSION,
+        "names": [gallery.names[r] for r in rows],
+        "rolls": [gallery.rolls[r] for r in rows],
+        "departments": [gallery.departments[r] for r in rows],
+        "sections": [gallery.sections[r] for r in rows]
+    }
+    name = gallery_snapshot.write_snapshot(directory, encodings, meta, index)
+    if compact:
+        gallery.snapshot = name
+    return name
+
+def _load_gallery():
+    """
+    Maps the host snapshot when it belongs to the current epoch (the delta
+    since then is pulled by the next sync), otherwise reads Mongo and writes
+    a fresh snapshot for the other workers.
+    """
+    directory = gallery_snapshot.SNAPSHOT_DIR
+    if not directory:
+        return _load_gallery_from_db()
+
+    meta = _read_meta(_get_db())
+    name = gallery_snapshot.current_snapshot(directory)
+    stamp = gallery_snapshot.snapshot_stamp(name)
+    if stamp is not None and stamp[0] == meta.get("epoch", 0):
+        try:
+            gallery = _load_gallery_from_snapshot(directory, name)
+            if gallery is not None:
+                return gallery
+        except Exception as e:
+            print(f"Gallery snapshot {name} unreadable, loading from Mongo: {e}")
+
+    gallery = _load_gallery_from_db(meta)
+    try:
+        save_snapshot(gallery, directory)
+    except Exception as e:
+        print(f"Gallery snapshot write failed: {e}")
+    return gallery
 
 def get_student_data():
     """
-    Returns a singleton dictionary containing names, rolls, and normalized encodings.
-    Loading once saves memory and prevents redundant DB queries on startup.
+    Returns the singleton StudentGallery (names, rolls, normalized encodings).
+    Loading once saves memory and prevents redundant DB queries on startup;
+    afterwards only a throttled version check runs per call.
     """
     global _student_data
     if _student_data is None:
-        print(">>> Loading Student Data (Singleton) <<<")
-        MONGO_URI = os.getenv("MONGO_URI")
-        client = MongoClient(MONGO_URI)
-        db = client["AttendanceDB"]
-        students_col = db["students"]
-
-        names, rolls, encodings = [], [], []
-        for doc in students_col.find({"model": "arcface"}):
-            names.append(doc["name"])
-            rolls.append(str(doc["rollNo"]))
-            emb = np.array(doc["face_encoding"], dtype=float)
-            # Normalize immediately
-            emb = emb / norm(emb)
-            encodings.append(emb)
-        
-        _student_data = {
-            "names": names,
-            "rolls": rolls,
-            "encodings": np.stack(encodings) if encodings else np.empty((0, 512))
-        }
+        with _load_lock:
+            if _student_data is None:
+                _student_data = _load_gallery()
+    else:
+        sync_student_data()
     return _student_data
 
+def sync_student_data(force=False):
+    """
+    Pulls changes made by other workers.
+    A newer gallery_meta version pulls only students registered since the
+    watermark (minus GALLERY_SYNC_OVERLAP); a newer epoch (removals) triggers a full reload. Concurrent
+    callers wait for the running sync and then return its result.
+    """
+    global _last_sync, _student_data
+    if _student_data is None or (not force and time.monotonic() - _last_sync < GALLERY_SYNC_INTERVAL):
+        return _student_data
+    with _sync_lock:
+        now = time.monotonic()
+        if not force and now - _last_sync < GALLERY_SYNC_INTERVAL:
+            return _student_data
+        _last_sync = now
+        gallery = _student_data
+        try:
+            # A newer host snapshot is swapped in before pulling the Mongo delta
+            directory = gallery_snapshot.SNAPSHOT_DIR
+            if directory:
+                name = gallery_snapshot.current_snapshot(directory)
+                stamp = gallery_snapshot.snapshot_stamp(name)
+                if name != gallery.snapshot and stamp is not None and stamp > (gallery.epoch, gallery.version):
+                    gallery = _student_data = _load_gallery_from_snapshot(directory, name) or gallery
+
+            db = _get_db()
+            meta = _read_meta(db)
+            if meta.get("epoch", 0) != gallery.epoch:
+                return reload_student_data()
+            version = meta.get("version", 0)
+            if version <= gallery.version:
+                return gallery
+
+            watermark = gallery.watermark
+            since = watermark - timedelta(seconds=GALLERY_SYNC_OVERLAP) if watermark is not None else None
+            pending = []
+            for roll, encoding, dtype, registered_at in _iter_embeddings(db, since=since):
+                # The overlap re-reads documents we already hold, skip those
+                if roll in gallery and registered_at is not None and gallery.stamps.get(roll) == registered_at:
+                    continue
+                pending.append({"rollNo": roll, "encoding": encoding, "dtype": dtype, "registeredAt": registered_at})
+
+            pulled = 0
+            if pending:
+                roster = {
+                    str(doc["rollNo"]): doc
+                    for doc in db["students"].find({"rollNo": {"$in": [p["rollNo"] for p in pending]}}, ROSTER_FIELDS)
+                }
+                for embedding in pending:
+                    student = roster.get(embedding["rollNo"])
+                    if student is not None:
+                        gallery.apply_embedding(embedding, student)
+                        pulled += 1
+                        # Same rule as the full load: the newest registeredAt actually applied
+                        registered_at = embedding["registeredAt"]
+                        if registered_at and (gallery.watermark is None or registered_at > gallery.watermark):
+                            gallery.watermark = registered_at
+            gallery.version = version
+            if pulled:
+                print(f"Gallery synced to version {version}: {pulled} student(s) pulled")
+        except Exception as e:
+            print(f"Gallery sync failed: {e}")
+        return gallery
+
+def record_student_change(student=None, embedding=None, removed_roll=None):
+    """
+    Applies a registration (roster document + embeddings document) or a
+    removal locally and bumps gallery_meta so the other workers pick it up
+    on their next version check.
+    """
+    gallery = get_student_data()
+    db = _get_db()
+    with _sync_lock:
+        if removed_roll is not None:
+            gallery.remove(removed_roll)
+            inc = {"version": 1, "epoch": 1}
+        else:
+            # registeredAt comes from this host's clock, so it does not move the
+            # watermark; the next delta re-reads it and everything after it
+            gallery.apply_embedding(embedding, student)
+            inc = {"version": 1}
+
+        meta = db["gallery_meta"].find_one_and_update(
+            {"_id": GALLERY_META_ID},
+            {"$inc": inc, "$set": {"updatedAt": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        # Adopt the new version only if nobody else changed the gallery meanwhile
+        if meta.get("version", 0) == gallery.version + 1:
+            gallery.version = meta["version"]
+            gallery.epoch = meta.get("epoch", 0)
+    return gallery
+
 def reload_student_data():
     """Force refresh the student data cache."""
     global _student_data
-    _student_data = None
-    return get_student_data()
+    _student_data = _load_gallery()
+    return _student_data
@@ -2,7 +2,7 @@ import React, { useState, useRef, useEffect, useMemo, useCallback } from 'react'
 import { useNavigate, useLocation } from 'react-router-dom';
 import Webcam from 'react-webcam';
 import * as faceapi from 'face-api.js';
-import { recognizeFrame, storeExcel, getStudentsBySection, submitManualOverride, takeLiveAttendance } from '../services/api';
+import { recognizeFrame, openRecognitionSession, closeRecognitionSession, openRecognitionStream, storeExcel, getStudentsBySection, submitManualOverride, takeLiveAttendance, finalizeLiveAttendance } from '../services/api';
 import ManualOverrideModal from './ManualOverrideModal';
 
 const LiveAttendance = () => {
@@ -114,6 +114,9 @@ const LiveAttendance = () => {
   const webcamRef = useRef(null);
   const canvasRef = useRef(null);
   const fileInputRef = useRef(null);
+  const sessionIdRef = useRef(null);
+  const clientBoxesRef = useRef([]); // Latest browser-side detections, sent as ROIs
+  const streamRef = useRef(null); // Open recognition WebSocket, if the server supports it
 
   // Load Models
   useEffect(() => {
@@ -160,6 +163,10 @@ const LiveAttendance = () => {
             if (!canvasRef.current) return;
             const displaySize = { width: video.videoWidth, height: video.videoHeight };
             const resizedDetections = faceapi.resizeResults(detections, displaySize);
+            clientBoxesRef.current = detections.map(d => {
+              const { x, y, width, height } = d.box;
+              return [Math.round(x), Math.round(y), Math.round(width), Math.round(height)];
+            });
             const ctx = canvasRef.current.getContext('2d');
             if (ctx) {
               ctx.clearRect(0, 0, canvasRef.current.width, canvasRef.current.height);
@@ -215,6 +222,32 @@ const LiveAttendance = () => {
     return () => clearInterval(interval);
   }, [isScanning, recognizedFaces]);
 
+  // Live recognition session: the server tracks faces across frames and
+  // accumulates recognised students, so saving needs no second inference pass
+  const ensureSession = useCallback(async () => {
+    if (sessionIdRef.current) return sessionIdRef.current;
+    try {
+      const res = await openRecognitionSession(className);
+      sessionIdRef.current = res.data.session_id;
+    } catch (err) {
+      console.error("Could not open recognition session", err);
+    }
+    return sessionIdRef.current;
+  }, [className]);
+
+  useEffect(() => {
+    if (isScanning) ensureSession();
+  }, [isScanning, ensureSession]);
+
+  useEffect(() => {
+    return () => {
+      if (sessionIdRef.current) {
+        closeRecognitionSession(sessionIdRef.current).catch(() => { });
+        sessionIdRef.current = null;
+      }
+    };
+  }, []);
+
   // Upload Logic
   const handleFileUpload = async (e) => {
     const files = Array.from(e.target.files);
@@ -255,6 +288,12 @@ const LiveAttendance = () => {
     setProcessing(true);
     const formData = new FormData();
     formData.append('image', currentImage.file);
+    formData.append('class', className);
+    const sessionId = await ensureSession();
+    if (sessionId) {
+      formData.append('session_id', sessionId);
+      formData.append('track', '0');
+    }
 
     try {
       const response = await recognizeFrame(formData);
@@ -376,12 +415,101 @@ const LiveAttendance = () => {
     localStorage.removeItem(key);
   }, [uploadedImages, className, section]);
 
-  // Recognition Loop (Live Camera)
+  const applyLiveMatches = useCallback((matches) => {
+    if (!matches || matches.length === 0) return;
+    setRecognizedFaces(matches);
+
+    setAttendees(prev => {
+      let newPrev = [...prev];
+      matches.forEach(match => {
+        if (match.name === "Unknown") return;
+
+        const existingIndex = newPrev.findIndex(a => a.roll === match.roll);
+        if (existingIndex === -1) {
+          newPrev.push({
+            sNo: newPrev.length + 1,
+            roll: match.roll,
+            name: match.name,
+            img: 'captured.jpg',
+            sources: ['live']
+          });
+        } else {
+          const existing = newPrev[existingIndex];
+          newPrev[existingIndex] = {
+            ...existing,
+            sources: existing.sources && !existing.sources.includes('live')
+              ? [...existing.sources, 'live']
+              : existing.sources || ['live']
+          };
+        }
+      });
+      return newPrev;
+    });
+  }, []);
+
+  const streamOpen = () => streamRef.current && streamRef.current.readyState === WebSocket.OPEN;
+
+  // Streaming Loop (Live Camera): frames go over one WebSocket, the server
+  // drops stale frames itself, so we can push faster than the HTTP loop
+  useEffect(() => {
+    if (!isScanning) return;
+    let cancelled = false;
+    let sendInterval;
+
+    ensureSession().then(sessionId => {
+      if (cancelled) return;
+      let ws;
+      try {
+        ws = openRecognitionStream({ className, sessionId });
+      } catch (e) {
+        return; // No WebSocket support: the HTTP loop below keeps working
+      }
+      ws.binaryType = 'arraybuffer';
+      streamRef.current = ws;
+      let authenticated = false; // Frames only after the server confirmed the session
+
+      ws.onmessage = (event) => {
+        try {
+          const message = JSON.parse(event.data);
+          if (message.type === 'session') {
+            authenticated = true;
+            sessionIdRef.current = message.session_id;
+          }
+          else if (message.type === 'matches') applyLiveMatches(message.matches);
+        } catch (e) { }
+      };
+      ws.onclose = () => {
+        if (streamRef.current === ws) streamRef.current = null;
+      };
+
+      sendInterval = setInterval(async () => {
+        if (!webcamRef.current || !authenticated || ws.readyState !== WebSocket.OPEN) return;
+        const imageSrc = webcamRef.current.getScreenshot();
+        if (!imageSrc) return;
+        const blob = await (await fetch(imageSrc)).blob();
+        if (clientBoxesRef.current.length > 0) {
+          ws.send(JSON.stringify({ boxes: clientBoxesRef.current }));
+        }
+        ws.send(await blob.arrayBuffer());
+      }, 400);
+    });
+
+    return () => {
+      cancelled = true;
+      clearInterval(sendInterval);
+      if (streamRef.current) {
+        streamRef.current.close();
+        streamRef.current = null;
+      }
+    };
+  }, [isScanning, className, ensureSession, applyLiveMatches]);
+
+  // Recognition Loop (Live Camera), HTTP fallback when no stream is open
   useEffect(() => {
     let scanInterval;
     if (isScanning) {
       scanInterval = setInterval(async () => {
-        if (!processing && webcamRef.current) {
+        if (!processing && webcamRef.current && !streamOpen()) {
           setProcessing(true);
           const imageSrc = webcamRef.current.getScreenshot();
           if (imageSrc) {
@@ -389,49 +517,29 @@ const LiveAttendance = () => {
             const blob = await res.blob();
             const data = new FormData();
             data.append('image', blob);
+            data.append('class', className);
+            if (sessionIdRef.current) {
+              data.append('session_id', sessionIdRef.current);
+            }
+            // Server only searches these regions (with a full-frame fallback)
+            if (clientBoxesRef.current.length > 0) {
+              data.append('boxes', JSON.stringify(clientBoxesRef.current));
+            }
             try {
               const response = await recognizeFrame(data);
-              const matches = response.data.matches;
-              if (matches && matches.length > 0) {
-                setRecognizedFaces(matches);
-
-                setAttendees(prev => {
-                  let newPrev = [...prev];
-                  matches.forEach(match => {
-                    if (match.name === "Unknown") return;
-
-                    const existingIndex = newPrev.findIndex(a => a.roll === match.roll);
-                    if (existingIndex === -1) {
-                      newPrev.push({
-                        sNo: newPrev.length + 1,
-                        roll: match.roll,
-                        name: match.name,
-                        img: 'captured.jpg',
-                        sources: ['live']
-                      });
-                    } else {
-                      const existing = newPrev[existingIndex];
-                      newPrev[existingIndex] = {
-                        ...existing,
-                        sources: existing.sources && !existing.sources.includes('live')
-                          ? [...existing.sources, 'live']
-                          : existing.sources || ['live']
-                      };
-                    }
-                  });
-                  return newPrev;
-                });
-                // Keep faces visible for 2 seconds then clear or let next scan update
-                // setTimeout(() => setRecognizedFaces([]), 2000); 
-              }
-            } catch (err) { console.error(err); }
+              applyLiveMatches(response.data.matches);
+            } catch (err) {
+              // Session expired on the server: fall back to stateless frames
+              if (err.response?.status === 404) sessionIdRef.current = null;
+              console.error(err);
+            }
           }
           setProcessing(false);
         }
       }, 1000); // Optimized: Increased from 800ms to 1000ms for better performance
     }
     return () => clearInterval(scanInterval);
-  }, [isScanning, processing]);
+  }, [isScanning, processing, applyLiveMatches]);
 
   // Save Logic
   const handleSaveClick = () => {
@@ -496,24 +604,37 @@ const LiveAttendance = () => {
     }
 
     try {
-      // 1. Save attendance records to MongoDB via /api/attendance/live
-      const attendanceFormData = new FormData();
+      // 1. Save attendance records to MongoDB
+      const allScanned = uploadedImages.every(img => img.scanned);
+      if (sessionIdRef.current && allScanned) {
+        // Everything was already recognised in this session: finalize from its results
+        await finalizeLiveAttendance({
+          session_id: sessionIdRef.current,
+          course: saveData.course || 'Unknown Subject',
+          class: className,
+          hour: saveData.hour || '1',
+          report_type: 'both'
+        });
+        sessionIdRef.current = null;
+      } else {
+        const attendanceFormData = new FormData();
 
-      // Add uploaded images if any
-      uploadedImages.forEach((img, idx) => {
-        if (img.file) {
-          attendanceFormData.append('images', img.file);
-        }
-      });
+        // Add uploaded images if any
+        uploadedImages.forEach((img, idx) => {
+          if (img.file) {
+            attendanceFormData.append('images', img.file);
+          }
+        });
 
-      // Add metadata
-      attendanceFormData.append('course', saveData.course || 'Unknown Subject');
-      attendanceFormData.append('class', className);
-      attendanceFormData.append('hour', saveData.hour || '1');
-      attendanceFormData.append('report_type', 'both');
+        // Add metadata
+        attendanceFormData.append('course', saveData.course || 'Unknown Subject');
+        attendanceFormData.append('class', className);
+        attendanceFormData.append('hour', saveData.hour || '1');
+        attendanceFormData.append('report_type', 'both');
 
-      // Call the backend to save attendance records
-      await takeLiveAttendance(attendanceFormData);
+        // Call the backend to save attendance records
+        await takeLiveAttendance(attendanceFormData);
+      }
 
       // 2. Save Excel file to GridFS
       const fileBlob = generateCSV();
@@ -943,6 +1064,8 @@ const LiveAttendance = () => {
                     audio={false}
                     ref={webcamRef}
                     screenshotFormat="image/jpeg"
+                    // Frames at the video's native size, the coordinate space of clientBoxesRef
+                    forceScreenshotSourceSize
                     style={{
                       maxWidth: '100%',
                       maxHeight: '100%',
@@ -68,6 +68,10 @@ export const takeLiveAttendance = (formData) => {
   });
 };
 
+export const finalizeLiveAttendance = (data) => {
+  return api.post('/api/attendance/live/finalize', data);
+};
+
 export const takeGroupAttendance = (formData) => {
   return api.post('/api/attendance/group', formData, {
     headers: {
@@ -104,6 +108,26 @@ export const recognizeFrame = (formData) => {
   });
 };
 
+export const openRecognitionSession = (className) => {
+  return api.post('/api/recognition/session', { class: className });
+};
+
+export const closeRecognitionSession = (sessionId) => {
+  return api.delete(`/api/recognition/session/${sessionId}`);
+};
+
+// Streaming recognition: binary JPEG frames up, JSON match results down
+export const openRecognitionStream = ({ className, sessionId }) => {
+  const params = new URLSearchParams({ class: className || '' });
+  if (sessionId) params.set('session_id', sessionId);
+  const ws = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/ws/recognition?${params}`);
+  // The token goes in the first message, not the URL, so it stays out of access logs
+  ws.addEventListener('open', () => {
+    ws.send(JSON.stringify({ type: 'auth', token: localStorage.getItem('token') || '' }));
+  });
+  return ws;
+};
+
 // HOD Auth
 export const loginHOD = (formData) => {
   return api.post('/api/hod/login', formData);